@@ -0,0 +1,230 @@
+'''
+python3.12 bench.py --events 5000 --depth 6 --fan-in 2 --segments 20 --out bench.json
+python3.12 bench.py --events 5000 --compare bench.json
+'''
+
+from __future__ import annotations
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import typing as t
+import collections.abc as t_abc
+from pathlib import Path
+
+import yaml
+
+import c3
+import event
+
+
+def generate(
+    p: Path,
+    events: int,
+    depth: int,
+    fan_in: int,
+    segments: int,
+    files: int,
+    seed: int = 0,
+) -> None:
+    # every segment gets `depth` levels of abstract bases, each one inheriting from `fan_in` bases of the
+    # previous level (so lookups walk mros of about depth * fan_in nodes), and its share of concrete events
+    # inheriting from the last level. bases of a node are consecutive, which keeps every mro legal.
+    rnd = random.Random(seed)
+    sep = '\n' + event.segment_sep + '\n'
+    width = max(fan_in, 2)
+
+    (p / '__builtins__.yaml').write_text(
+        '$$math:\n  discipline: math\n$$physics:\n  discipline: physics\n', encoding='utf-8'
+    )
+
+    dates = [
+        lambda: f'{rnd.randint(1, 28):02}.{rnd.randint(1, 12):02}.{rnd.randint(2008, 2025)}',
+        lambda: f'{rnd.randint(2008, 2024)}-{rnd.randint(2009, 2025)}',
+        lambda: {'start': f'01.{rnd.randint(1, 9):02}.2024', 'end': f'01.{rnd.randint(10, 12):02}.2024'},
+        lambda: [{'moment': f'{rnd.randint(1, 28):02}.03.2025', 'note': f'{i}-й день'} for i in (1, 2)],
+        lambda: 'конец ноября',
+        lambda: rnd.randint(2008, 2025),
+    ]
+
+    total_segments = segments * files
+    n = 0
+    for f in range(files):
+        parts = []
+        for s in range(segments):
+            seg = f * segments + s
+            lines: list[str] = []
+
+            def add(id: str, bases: list[str], fields: dict[str, t.Any]) -> None:
+                defi = ({'$': ' '.join(bases)} if bases else {}) | fields
+                lines.append(yaml.safe_dump({id: defi}, allow_unicode=True, sort_keys=False))
+
+            prev = ['$$math' if seg % 2 == 0 else '$$physics']
+            for level in range(depth):
+                cur = [f'$b{seg}_{level}_{k}' for k in range(width)]
+                for k, id in enumerate(cur):
+                    lo = min(k, max(0, len(prev) - fan_in))
+                    fields: dict[str, t.Any] = {f'field_{level}': k, f'name_{level}': f'{level}.{k}'}
+                    if level == 0:
+                        fields |= {
+                            'name': f'{{name_0}} {{name_{depth - 1}}}',
+                            f'name_{depth - 1}': '?',
+                            'url': f'https://example.com/{seg}/',
+                            'num_stages': 3,
+                            'grades': f'{rnd.randint(1, 6)}-{rnd.randint(7, 11)}',
+                            'urls': [{'url': f'https://example.com/{seg}/archive', 'note': 'архив'}],
+                        }
+                    if level == depth - 1:
+                        fields |= {'diff': rnd.randint(1, 5), 'format': rnd.choice(['online', 'offline'])}
+                    add(id, prev[lo : lo + fan_in], fields)
+                prev = cur
+
+            count = events // total_segments + (seg < events % total_segments)
+            for i in range(count):
+                lo = rnd.randint(0, len(prev) - fan_in)
+                fields = {'stage': rnd.randint(1, 3), 'date': rnd.choice(dates)()}
+                if rnd.random() < 0.3:
+                    fields['rating'] = rnd.randint(1, 3)
+                add(f'e{n}', prev[lo : lo + fan_in], fields)
+                n += 1
+
+            parts.append('\n'.join(lines))
+        (p / f'f{f}.yaml').write_text(sep.join(parts), encoding='utf-8')
+
+
+def measure(fn: t_abc.Callable[[], t.Any], repeat: int) -> dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'runs': repeat}
+
+
+def run(p: Path, repeat: int) -> dict[str, dict[str, float]]:
+    import main as app
+
+    res: dict[str, dict[str, float]] = {}
+
+    res['load'] = measure(lambda: event.load(p, workers=1), repeat)
+    root = event.load(p, workers=1)
+    items = list(root.items())
+    res['load.freeze'] = measure(lambda: event.freeze(root), repeat)
+    frozen = event.freeze(root)
+    frozen_items = list(frozen.items())
+
+    res['c3'] = measure(lambda: [c3.c3(e, lambda x: x.__C_b__) for _, e in items], repeat)
+
+    keys = ['id', 'name', 'date', 'grades', 'discipline', 'missing']
+
+    def lookups(events: list[tuple[str, event.Event]]) -> None:
+        for _, e in events:
+            for k in keys:
+                e.get(k)
+
+    c3._invalidate()
+    res['getitem.cold'] = measure(lambda: (c3._invalidate(), lookups(items)), repeat)
+    res['getitem'] = measure(lambda: lookups(items), repeat)
+    res['getitem.frozen'] = measure(lambda: lookups(frozen_items), repeat)
+
+    def display(events: list[tuple[str, event.Event]]) -> None:
+        for _, e in events:
+            try:
+                e.display()
+            except Exception:
+                pass
+
+    res['display'] = measure(lambda: display(items), repeat)
+    res['display.frozen'] = measure(lambda: display(frozen_items), repeat)
+
+    app.dir_events = p
+    app.dir_cache = p / '.cache'
+    app.WATCH = False
+    client = app.app.test_client()
+    for route in ['/data.json', '/raw.json', '/graph']:
+
+        def cold() -> None:
+            app.unload()
+            app.load_data()
+            client.get(route, headers={'Accept-Encoding': 'gzip'}).get_data()
+
+        def warm() -> None:
+            client.get(route, headers={'Accept-Encoding': 'gzip'}).get_data()
+
+        res[f'route {route} cold'] = measure(cold, repeat)
+        warm()
+        res[f'route {route}'] = measure(warm, repeat)
+
+    return res
+
+
+def compare(results: dict[str, t.Any], baseline: dict[str, t.Any], threshold: float) -> bool:
+    # prints relative changes of median times, returns False if anything got slower than `threshold`
+    ok = True
+    if results['params'] != baseline['params']:
+        print(f'warning: params differ from the baseline: {baseline["params"]}')
+    for name, r in results['results'].items():
+        if name not in baseline['results']:
+            print(f'{name:32} {r["median"] * 1000:10.2f} ms  (new)')
+            continue
+        b = baseline['results'][name]
+        ratio = r['median'] / b['median'] if b['median'] else float('inf')
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  REGRESSION'
+            ok = False
+        elif ratio < 1 - threshold:
+            mark = '  faster'
+        print(f'{name:32} {b["median"] * 1000:10.2f} -> {r["median"] * 1000:10.2f} ms  x{ratio:.2f}{mark}')
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='benchmarks on a generated event corpus')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=4, help='levels of abstract bases in a segment')
+    parser.add_argument('--fan-in', type=int, default=2, help='number of bases of every event')
+    parser.add_argument('--segments', type=int, default=10, help='segments per file')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=Path, help='write results to this json file')
+    parser.add_argument('--compare', type=Path, help='baseline json file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    params = {
+        'events': args.events,
+        'depth': args.depth,
+        'fan_in': args.fan_in,
+        'segments': args.segments,
+        'files': args.files,
+        'seed': args.seed,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        p = Path(tmp) / 'events'
+        p.mkdir()
+        generate(p, **params)
+        results = {
+            'params': params,
+            'python': platform.python_version(),
+            'results': run(p, args.repeat),
+        }
+
+    if args.out is not None:
+        args.out.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+    if args.compare is not None:
+        if not compare(results, json.loads(args.compare.read_text(encoding='utf-8')), args.threshold):
+            sys.exit(1)
+    else:
+        for name, r in results['results'].items():
+            print(f'{name:32} {r["median"] * 1000:10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
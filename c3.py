@@ -1,30 +1,74 @@
 from __future__ import annotations
+import threading
 import typing as t
 import collections.abc as t_abc
 
 
-def c3[X](x: X, get_bases: t_abc.Callable[[X], list[X]]) -> list[X]:
-    def merge(mros: list[list[X | None]]) -> list[X | None]:
-        if not any(mros):
-            return []
-        for candidate, *_ in mros:
-            if all(id(candidate) not in map(id, tail) for _, *tail in mros):
-                return [candidate] + merge(
-                    [tail if head is candidate else [head, *tail] for head, *tail in mros]
-                )
+def merge[X](seqs: list[list[X]]) -> list[X]:
+    seqs = [seq for seq in seqs if seq]
+    if len(seqs) == 1:
+        return list(seqs[0])
+    pos = [0] * len(seqs)
+    # how many sequences still hold a given element outside of their head
+    in_tail: dict[int, int] = {}
+    for seq in seqs:
+        for x in seq[1:]:
+            in_tail[id(x)] = in_tail.get(id(x), 0) + 1
+
+    res: list[X] = []
+    active = list(range(len(seqs)))
+    while active:
+        for i in active:
+            candidate = seqs[i][pos[i]]
+            if not in_tail.get(id(candidate)):
+                break
         else:
             raise TypeError("no legal mro")
 
-    def _c3(x: X) -> list[X | None]:
-        if bases := get_bases(x):
-            return [x] + merge([_c3(base) for base in bases])
-        else:
-            return [x, None]
-
-    m = _c3(x)
-    assert m[-1] is None
-    assert all(x is not None for x in m[:-1])
-    return m[:-1]  # type: ignore
+        res.append(candidate)
+        for i in active:
+            seq = seqs[i]
+            if seq[pos[i]] is candidate:
+                pos[i] += 1
+                if pos[i] < len(seq):
+                    in_tail[id(seq[pos[i]])] -= 1
+        active = [i for i in active if pos[i] < len(seqs[i])]
+    return res
+
+
+def c3[X](
+    x: X,
+    get_bases: t_abc.Callable[[X], list[X]],
+    memo: dict[int, list[X]] | None = None,
+) -> list[X]:
+    # `memo` maps id(node) to its linearization, it is both used and filled;
+    # linearizations start with the node itself, so ids in it can't be reused while it is alive
+    if memo is None:
+        memo = {}
+    if id(x) in memo:
+        return memo[id(x)]
+
+    # bases are copied, so lists changed by another thread while this runs can't break the walk
+    path = {id(x)}
+    stack = [(x, list(get_bases(x) or []), 0)]
+    while stack:
+        node, bases, i = stack[-1]
+        while i < len(bases) and id(bases[i]) in memo:
+            i += 1
+        if i < len(bases):
+            base = bases[i]
+            if id(base) in path:
+                raise TypeError(f"cycle in bases: {base!r}")
+            stack[-1] = (node, bases, i + 1)
+            path.add(id(base))
+            stack.append((base, list(get_bases(base) or []), 0))
+            continue
+
+        stack.pop()
+        path.remove(id(node))
+        memo[id(node)] = [node, *merge([memo[id(base)] for base in bases])]
+
+    return memo[id(x)]
 
 
 def test():
@@ -42,9 +86,18 @@ def test():
     except TypeError:
         pass # ok
     else:
-        raise Exception(f"expected error")
+        raise Exception("expected error")
 
     assert c3(7, {1:[],2:[],3:[],4:[1,2],5:[2,3],6:[1,3],7:[4,5,6]}.get) == [7, 4, 5, 6, 1, 2, 3]
+
+    assert c3(3, {1:[],2:[1,1],3:[2,1]}.get) == [3, 2, 1]
+    assert c3(0, ({i: [i + 1] for i in range(2000)} | {2000: []}).get) == list(range(2001))
+    try:
+        c3(1, {1:[2],2:[3],3:[2]}.get)
+    except TypeError:
+        pass # ok
+    else:
+        raise Exception("expected error")
     # fmt: on
 
     return True
@@ -53,13 +106,67 @@ def test():
 assert test()
 
 
+# bumped whenever bases of any `C` change; cached linearizations from older generations are stale
+_generation = 0
+# linearizations shared between all `C`s of the current generation, so common bases are linearized once
+_memo: dict[int, list[t.Any]] = {}
+# held while `_memo` is used and while the generation changes, so a linearization is stamped with
+# the generation it was computed in
+_lock = threading.Lock()
+
+
+def _invalidate() -> None:
+    global _generation
+    with _lock:
+        _generation += 1
+        _memo.clear()
+
+
+class _Bases[T](list[T]):
+    # list of bases that invalidates cached linearizations on every in-place mutation
+    __slots__ = ()
+
+
+def _invalidating(method: t_abc.Callable[..., t.Any]) -> t_abc.Callable[..., t.Any]:
+    # after the change: a linearization computed before it is done gets the old generation
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _invalidate()
+
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+for _name in (
+    'append', 'extend', 'insert', 'remove', 'pop', 'clear', 'sort', 'reverse',
+    '__setitem__', '__delitem__', '__iadd__', '__imul__',
+):
+    setattr(_Bases, _name, _invalidating(getattr(list, _name)))
+del _name
+
+
+_missing: t.Any = object()
+
+
 class C[K, V]:
-    __slots__ = ('__C_d__', '__C_b__')
+    __slots__ = ('__C_d__', '__C_b__', '__C_m__', '__C_g__')
     __C_d__: dict[K, V]
     __C_b__: list[t.Self]
+    __C_m__: list[t.Self] | None  # cached linearization
+    __C_g__: int  # generation of __C_m__
+
+    def _mro(self) -> list[t.Self]:
+        if self.__C_g__ != _generation:
+            with _lock:
+                if self.__C_g__ != _generation:
+                    self.__C_m__ = c3(self, lambda self: self.__C_b__, _memo)
+                    self.__C_g__ = _generation
+        return self.__C_m__  # type: ignore
 
     def mro(self) -> list[t.Self]:
-        return c3(self, lambda self: self.__C_b__)
+        return list(self._mro())
 
     def __repr__(self) -> str:
         # return f'{self.__class__.__qualname__}({self.__C_d__}, {self.__C_b__})'
@@ -67,13 +174,29 @@ class C[K, V]:
 
     def __init__(self, d: dict[K, V] | None = None, b: list[t.Self] | None = None):
         self.__C_d__ = d if d is not None else {}
-        self.__C_b__ = b if b is not None else []
+        object.__setattr__(self, '__C_b__', _Bases(b) if b is not None else _Bases())
+        self.__C_m__ = None
+        self.__C_g__ = -1
+
+    def __setattr__(self, attr: str, val: t.Any) -> None:
+        if attr == '__C_b__':
+            object.__setattr__(self, attr, _Bases(val))
+            _invalidate()
+            return
+        object.__setattr__(self, attr, val)
+
+    def _lookup[D](self, key: K, default: D) -> V | D:
+        for c in self._mro():
+            d = c.__C_d__
+            if key in d:
+                return d[key]
+        return default
 
     def __getitem__(self, key: K) -> t.Any:
-        for c in self.mro():
-            if key in c.__C_d__:
-                return c.__C_d__[key]
-        raise KeyError(key)
+        val = self._lookup(key, _missing)
+        if val is _missing:
+            raise KeyError(key)
+        return val
 
     # at = __getitem__
 
@@ -81,26 +204,18 @@ class C[K, V]:
         self.__C_d__[key] = val
 
     def __contains__(self, key: K) -> bool:
-        try:
-            self[key]
-        except KeyError:
-            return False
-        else:
-            return True
+        return self._lookup(key, _missing) is not _missing
 
     @t.overload
     def get(self, key: K, default: None = None) -> V | None: ...
     @t.overload
     def get[D](self, key: K, default: D) -> V | D: ...
     def get[D](self, key: K, default: D | None = None) -> V | D | None:
-        try:
-            return self[key]
-        except KeyError:
-            return default
+        return self._lookup(key, default)
 
     def items(self):
         keys = set[K]()
-        for c in self.mro():
+        for c in self._mro():
             for k, v in c.__C_d__.items():
                 if k not in keys:
                     keys.add(k)
@@ -110,8 +225,8 @@ class C[K, V]:
         return dump(self)
 
 def dump(self):
-    if isinstance(self, (C, dict)):
+    if isinstance(self, (C, t_abc.Mapping)):
         return {k: dump(v) for k, v in self.items()}
-    if isinstance(self, (list, tuple, set)):
+    if isinstance(self, (list, tuple, t_abc.Set)):
         return [dump(x) for x in self]
     return self
@@ -1,15 +1,22 @@
 from __future__ import annotations
 import dataclasses
-import io
 import sys
 import typing as t
 import collections.abc as t_abc
 import yaml
 from pathlib import Path
+import functools
+import hashlib
+import os
+import re
+import pickle
+import string
+import threading
 import time
+import types
 import statistics
 
-from c3 import C
+from c3 import C, c3, dump, merge
 
 
 emoji_star = '⭐'
@@ -34,10 +41,7 @@ junk = _FalsyJunk()
 
 class NS(C[str, t.Any]):
     def __getattr__(self, attr: str) -> t.Any:
-        try:
-            return self[attr]
-        except KeyError:
-            return junk
+        return self._lookup(attr, junk)
 
     def __setattr__(self, attr: str, val: t.Any) -> None:
         if attr.startswith('__') and attr.endswith('__'):
@@ -78,6 +82,13 @@ class Event(NS):
             'html': True,
             'style': 'max-width: 30ch;'
         },
+        {
+            'id': 'children',
+            'title': 'Наследники',
+            'sortable': False,
+            'html': True,
+            'style': 'max-width: 30ch;'
+        },
         {
             'id': 'name',
             'title': 'Название',
@@ -142,20 +153,26 @@ class Event(NS):
     #     'solutions_url': 'https://olympiads.mccme.ru/vmo/',
     # }
 
-    def display(self) -> dict[str, t.Any]:
+    def display(
+        self, debug: bool = True, timestamps: t_abc.Mapping[str, float | None] | None = None
+    ) -> dict[str, t.Any]:
+        # `timestamps` of dates from `get_timestamps`, dates of events missing there are converted here
+        if timestamps is None:
+            timestamps = {}
         res = {# id="{self.id.replace('$', '_meta_')}"
             'id': RespItem(
                 f'<a href="#{self.id.replace('$', '_meta_')}">{self.id}</a>',
                 sort_key=self.id.removeprefix('$'),
                 other=self.id.replace('$', '_meta_')),
             'parents': format_parents(self),
+            'children': format_children(self),
             'is_meta': self.id.startswith('$'),
             # 'name': ', '.join(str(v) for k, v in sorted(self.items()) if k.startswith('name') if v),
-            'name': self.name.format_map(self) if self.name is not junk else no_value,
+            'name': compile_name(self.name).render(self) if self.name is not junk else no_value,
             'stage': format_stage(self),
             'url': html_link(self.url, title='=>') if self.url else no_value,
             'grades': (
-                RespItem(dump_grades(self.grades), sort_key=sorted(self.grades))
+                RespItem(dump_grades(self.grades), sort_key=list(self.grades), other=int(self.grades))
                 if self.grades
                 else no_value
             ),
@@ -165,7 +182,10 @@ class Event(NS):
                 else no_value
             ),
             'date': (
-                RespItem(format_date(self.date), sort_key=get_timestamp(self.date))
+                RespItem(
+                    format_date(self.date),
+                    sort_key=timestamps[self.id] if self.id in timestamps else get_timestamp(self.date),
+                )
                 if self.date is not junk
                 else no_value
             ),
@@ -187,38 +207,164 @@ class Event(NS):
             'urls': (
                 format_urls(self.urls) if self.urls else no_value
             ),
-            'raw': repr(self),
-            'mro': repr([x.id for x in self.mro()]),
-            'extra': format_dict(
-                {
-                    k: v
-                    for k, v in self.items()
-                    if k
-                    not in {
-                        'id',
-                        'name',
-                        'name_main',
-                        'name_year',
-                        'name_stage',
-                        'name_num',
-                        'url',
-                        'solutions_url',
-                        'grades',
-                        'diff',
-                        'date',
-                        'rating',
-                        'stage',
-                        'num_stages',
-                        'format',
-                        # 'other',
-                    }
-                }
-            ),
         }
+        # only for debugging, and expensive
+        if debug:
+            res |= {
+                'raw': repr(self),
+                'mro': repr([x.id for x in self.mro()]),
+                'extra': format_dict(
+                    {
+                        k: v
+                        for k, v in self.items()
+                        if k
+                        not in {
+                            'id',
+                            'name',
+                            'name_main',
+                            'name_year',
+                            'name_stage',
+                            'name_num',
+                            'url',
+                            'solutions_url',
+                            'grades',
+                            'diff',
+                            'date',
+                            'rating',
+                            'stage',
+                            'num_stages',
+                            'format',
+                            # 'other',
+                        }
+                    }
+                ),
+            }
         res = {k: RespItem(v, v) if not isinstance(v, RespItem) else v for k, v in res.items()}
         res = {k: dataclasses.asdict(v) for k, v in res.items()}
         return res
 
+    def _children(self) -> t_abc.Sequence[Event]:
+        # events that list this one in their bases, known only for frozen events
+        return ()
+
+    def _own(self) -> dict[str, t.Any]:
+        # attributes set on this event itself, not inherited
+        return self.__C_d__
+
+    def _resolve(self, keys: t_abc.Collection[str]) -> t_abc.Mapping[str, t.Any]:
+        # own and inherited values of `keys` (those that are set), found in one walk over the mro
+        res: dict[str, t.Any] = {}
+        for c in self._mro():
+            d = c.__C_d__
+            for k in keys:
+                if k in d and k not in res:
+                    res[k] = d[k]
+            if len(res) == len(keys):
+                break
+        return res
+
+
+class FrozenAttrs(t_abc.Mapping[str, t.Any]):
+    # read-only attributes of a `FrozenEvent`: values in a tuple, positions of keys in a dict shared by all
+    # events with the same keys in the same order, so an event costs a tuple instead of a dict
+    __slots__ = ('index', 'values')
+
+    def __init__(self, index: dict[str, int], values: tuple[t.Any, ...]):
+        self.index = index
+        self.values = values
+
+    def __getitem__(self, key: str) -> t.Any:
+        return self.values[self.index[key]]
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        i = self.index.get(key)
+        return default if i is None else self.values[i]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> t_abc.Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def items(self) -> t_abc.Iterator[tuple[str, t.Any]]:  # type: ignore
+        return zip(self.index, self.values)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class FrozenEvent(Event):
+    # read-only snapshot of an `Event`, made by `freeze`:
+    # `__C_d__` holds all own and inherited attributes in lookup order, `__C_c__` are the children,
+    # `__C_o__` the own attributes (the dict of the `Event`, `_own` gives a read-only view).
+    # only debugging needs the mro, `__C_m__` is filled on first use
+    __slots__ = ('__C_c__', '__C_o__')
+    __C_d__: FrozenAttrs  # type: ignore
+    __C_c__: tuple[FrozenEvent, ...]
+    __C_o__: dict[str, t.Any]
+
+    def _mro(self) -> list[t.Self]:
+        if self.__C_m__ is None:
+            object.__setattr__(self, '__C_m__', [self, *merge([b._mro() for b in self.__C_b__])])
+        return self.__C_m__  # type: ignore
+
+    def _children(self) -> tuple[FrozenEvent, ...]:
+        return self.__C_c__
+
+    def _own(self) -> t_abc.Mapping[str, t.Any]:
+        return types.MappingProxyType(self.__C_o__)
+
+    def _resolve(self, keys: t_abc.Collection[str]) -> t_abc.Mapping[str, t.Any]:
+        return self.__C_d__
+
+    def _lookup[D](self, key: str, default: D) -> t.Any | D:
+        d = self.__C_d__
+        i = d.index.get(key)
+        return default if i is None else d.values[i]
+
+    def __getattr__(self, attr: str) -> t.Any:
+        d = self.__C_d__
+        i = d.index.get(attr)
+        return junk if i is None else d.values[i]
+
+    def __setattr__(self, attr: str, val: t.Any) -> None:
+        raise TypeError(f'{self.__class__.__qualname__} is read-only')
+
+    def __setitem__(self, key: str, val: t.Any) -> None:
+        raise TypeError(f'{self.__class__.__qualname__} is read-only')
+
+    def items(self):
+        return iter(self.__C_d__.items())
+
+    def __repr__(self) -> str:
+        # same as for the live `Event`, so the `raw` column doesn't change
+        return f'{Event.__qualname__}({self.__C_d__})'
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class NameTemplate:
+    template: str
+    fields: tuple[str, ...]  # keys `format_map` looks up: `{a.b[0]:spec}` needs `a`
+
+    def render(self, e: Event) -> str:
+        return self.template.format_map(e._resolve(self.fields))
+
+
+def _template_fields(template: str) -> t_abc.Iterator[str]:
+    for _, field, spec, _ in string.Formatter().parse(template):
+        if field is not None:
+            yield re.match(r'[^.\[]*', field).group()  # type: ignore
+        if spec:
+            yield from _template_fields(spec)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_name(template: str) -> NameTemplate:
+    return NameTemplate(template, tuple(dict.fromkeys(_template_fields(template))))
+
+
 def format_stage(self: Event) -> t.Any:
     match self.stage, self.num_stages:
         case (int(), int()):
@@ -242,6 +388,26 @@ def format_parents(self: Event) -> str:
     return res.strip()
 
 
+def format_children(self: Event) -> str:
+    return ' '.join(
+        html_link(f'#{e.id.replace('$', '_meta_')}', title=e.id) for e in self._children() if 'id' in e
+    )
+
+
+def descendants(self: Event) -> list[Event]:
+    # transitive children in breadth-first order, only the subtree is visited
+    seen = {id(self)}
+    res: list[Event] = []
+    queue = [self]
+    for e in queue:
+        for child in e._children():
+            if id(child) not in seen:
+                seen.add(id(child))
+                res.append(child)
+                queue.append(child)
+    return res
+
+
 # %Y  Year with century as a decimal number.
 # %m  Month as a decimal number [01,12].
 # %d  Day of the month as a decimal number [01,31].
@@ -283,10 +449,59 @@ def format_date(d: t.Any) -> str:
             return repr(d)
 
 
+def _time_format_pattern(fmt: str) -> re.Pattern[str] | None:
+    # a cheap regex that matches everything `time.strptime(s, fmt)` accepts (and maybe more),
+    # so formats that can't match are skipped without raising;
+    # None if `fmt` uses a directive it doesn't know
+    directives = {
+        '%Y': r'\d{4}',
+        '%m': r'\d{1,2}',
+        '%d': r' ?\d{1,2}',
+        '%H': r'\d{1,2}',
+        '%M': r'\d{1,2}',
+    }
+    res = ''
+    for part in re.split(r'(%.|\s+)', fmt):
+        if part in directives:
+            res += directives[part]
+        elif part.startswith('%'):
+            return None
+        elif part.isspace():
+            res += r'\s+'
+        else:
+            res += re.escape(part)
+    return re.compile(res)
+
+
+_time_formats = [(fmt, _time_format_pattern(fmt)) for fmt in allowed_time_formats]
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_str_timestamp(d: str) -> float | None:
+    d = d.strip()
+    if '-' in d:
+        start, _, end = d.partition('-')
+        return get_timestamp(
+            {
+                'start': start.strip(),
+                'end': end.strip(),
+            }
+        )
+
+    for fmt, pattern in _time_formats:
+        if pattern is not None and not pattern.fullmatch(d):
+            continue
+        try:
+            return time.mktime(time.strptime(d, fmt))
+        except ValueError:
+            pass
+    return None
+
+
 def get_timestamp(d: t.Any) -> float | None:
     match d:
         case [*_]:
-            return statistics.mean([get_timestamp(x) for x in d if get_timestamp(x)])
+            return statistics.mean([ts for x in d if (ts := get_timestamp(x))])
         case {'moment': moment}:
             return get_timestamp(moment)
         case {'start': start, 'end': end}:
@@ -307,26 +522,89 @@ def get_timestamp(d: t.Any) -> float | None:
             return get_timestamp(str(d)) or get_timestamp('0' + str(d))
 
         case str():
-            d = d.strip()
-            if '-' in d:
-                start, _, end = d.partition('-')
-                return get_timestamp(
-                    {
-                        'start': start.strip(),
-                        'end': end.strip(),
-                    }
-                )
-
-            for fmt in allowed_time_formats:
-                try:
-                    return time.mktime(time.strptime(d, fmt))
-                except ValueError:
-                    pass
-            return None
+            return _get_str_timestamp(d)
         case _:
             return None
 
 
+# (start, end, note): the period a date names, from its first second to the first second after it
+type Interval = tuple[float, float, str | None]
+
+
+def _period_end(st: time.struct_time, fmt: str) -> float:
+    y, m, d, hour, minute = st[:5]
+    if '%M' in fmt:
+        return time.mktime((y, m, d, hour, minute + 1, 0, 0, 0, -1))
+    if '%d' in fmt:
+        return time.mktime((y, m, d + 1, 0, 0, 0, 0, 0, -1))
+    if '%m' in fmt:
+        return time.mktime((y, m + 1, 1, 0, 0, 0, 0, 0, -1))
+    return time.mktime((y + 1, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+def _span(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    # one interval covering both sides of a range, or the side that is known
+    if not a or not b:
+        return a or b
+    return [(min(x[0] for x in a + b), max(x[1] for x in a + b), None)]
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_str_intervals(d: str) -> tuple[Interval, ...]:
+    # same cases as `_get_str_timestamp`
+    d = d.strip()
+    if '-' in d:
+        start, _, end = d.partition('-')
+        return tuple(_span(get_intervals(start.strip()), get_intervals(end.strip())))
+
+    for fmt, pattern in _time_formats:
+        if pattern is not None and not pattern.fullmatch(d):
+            continue
+        try:
+            st = time.strptime(d, fmt)
+        except ValueError:
+            continue
+        return ((time.mktime(st), _period_end(st, fmt), None),)
+    return ()
+
+
+def get_intervals(d: t.Any) -> list[Interval]:
+    # periods a date covers, for the forms `get_timestamp` understands; lists give one per item
+    match d:
+        case [*_]:
+            return [iv for x in d for iv in get_intervals(x)]
+        case {'moment': moment}:
+            return [(s, e, d.get('note')) for s, e, _ in get_intervals(moment)]
+        case {'start': start, 'end': end}:
+            return [(s, e, d.get('note')) for s, e, _ in _span(get_intervals(start), get_intervals(end))]
+        case int():
+            return get_intervals(str(d))
+        case float():
+            return get_intervals(str(d)) or get_intervals('0' + str(d))
+        case str():
+            return list(_get_str_intervals(d))
+        case _:
+            return []
+
+
+def get_timestamps(events: t_abc.Iterable[Event]) -> dict[str, float | None]:
+    # timestamps of the `date` of every event in one pass; inherited dates are the same objects, so
+    # each of them is converted once. events whose date can't be converted (`get_timestamp` raises) are left out
+    res: dict[str, float | None] = {}
+    seen: dict[int, tuple[t.Any, float | None | Exception]] = {}
+    for e in events:
+        d = e.date
+        if id(d) not in seen:
+            try:
+                seen[id(d)] = d, get_timestamp(d)
+            except Exception as exc:
+                seen[id(d)] = d, exc
+        ts = seen[id(d)][1]
+        if not isinstance(ts, Exception):
+            res[e.id] = ts
+    return res
+
+
 def format_urls(d: t.Any) -> str:
     match d:
         case str():
@@ -350,48 +628,121 @@ def format_urls(d: t.Any) -> str:
             return repr(d)
 
 
-def parse_grades(s: str) -> set[int]:
+class Grades(int):
+    # set of grades as a bitmask, grade `g` is bit `1 << g`; iterates over grades in ascending order
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, grades: t_abc.Iterable[int]) -> Grades:
+        res = 0
+        for g in grades:
+            res |= 1 << g
+        return cls(res)
+
+    @classmethod
+    def range(cls, lo: int, hi: int) -> Grades:
+        return cls(((1 << (hi - lo + 1)) - 1) << lo if lo <= hi else 0)
+
+    def __iter__(self) -> t_abc.Iterator[int]:
+        m = int(self)
+        while m:
+            low = m & -m
+            yield low.bit_length() - 1
+            m ^= low
+
+    def __len__(self) -> int:
+        return self.bit_count()
+
+    def __contains__(self, g: object) -> bool:
+        return isinstance(g, int) and g >= 0 and bool(self >> g & 1)
+
+    def __and__(self, other: int) -> Grades:
+        return Grades(int(self) & other)
+
+    def __or__(self, other: int) -> Grades:
+        return Grades(int(self) | other)
+
+    def intersects(self, other: int) -> bool:
+        return bool(self & other)
+
+    def covers(self, lo: int, hi: int) -> bool:
+        # all grades from `lo` to `hi` are in the set
+        r = Grades.range(lo, hi)
+        return self & r == r
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__qualname__}({dump_grades(self)!r})'
+
+
+# so `c3.dump` (and json through it) sees a set of grades, not the mask
+t_abc.Set.register(Grades)
+
+
+def parse_grades(s: str) -> Grades:
     s = str(s)
 
-    def parse_item(s: str) -> set[int]:
+    def parse_item(s: str) -> Grades:
         if '-' not in s:
-            return {int(s)}
+            return Grades.of([int(s)])
         mn, mx = map(int, s.split('-'))
-        return set(range(mn, mx + 1))
+        return Grades.range(mn, mx)
 
-    return set.union(*map(parse_item, s.split(',')))
+    res = Grades(0)
+    for item in s.split(','):
+        res |= parse_item(item)
+    return res
 
 
-def dump_grades(s: set[int]) -> str:
-    return ','.join('-'.join(map(str, rng)) for rng in collapse_numbers_into_ranges(s))
+def dump_grades(s: Grades | t_abc.Iterable[int]) -> str:
+    # runs of set bits are ranges
+    m = int(s) if isinstance(s, int) else int(Grades.of(s))
+    res = []
+    while m:
+        lo = (m & -m).bit_length() - 1
+        run = m >> lo
+        n = (~run & (run + 1)).bit_length() - 1
+        res.append(f'{lo}' if n == 1 else f'{lo}-{lo + n - 1}')
+        m ^= ((1 << n) - 1) << lo
+    return ','.join(res)
 
 
 def format_dict(self) -> str:
     return '\n'.join(f'{k}: {v}' for k, v in self.items())
 
 
-def collapse_numbers_into_ranges(nums: t_abc.Iterable[int]) -> t_abc.Iterator[list[int]]:
-    import itertools
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-    rng = []
-    for x in itertools.chain(sorted(nums), [t.cast(int, ...)]):
-        if not rng:
-            rng = [x, x]
-            continue
-        if x == rng[-1] + 1:
-            rng[-1] = x
-        else:
-            yield rng if rng[0] != rng[1] else [rng[0]]
-            rng = [x, x]
+# segments are parsed in worker processes only when there is enough text to pay for starting them
+parallel_threshold = 1 << 20
 
 
-def _load_segment(text: str, blt: C[str, Event]) -> C[str, Event]:
+def _parse_segment(text: str) -> tuple[t.Any, float]:
+    start = time.perf_counter()
     try:
-        data = yaml.safe_load(io.StringIO(text))
+        data = yaml.load(text, Loader=_yaml_loader)
     except Exception:
         print(text)
         raise
+    return data, time.perf_counter() - start
+
+
+def _parse_segments(texts: list[str], workers: int) -> list[tuple[t.Any, float]]:
+    if workers <= 1 or len(texts) < 2 or sum(map(len, texts)) < parallel_threshold:
+        return [_parse_segment(text) for text in texts]
+
+    import concurrent.futures
+    import multiprocessing
 
+    workers = min(workers, len(texts))
+    with concurrent.futures.ProcessPoolExecutor(
+        workers,
+        # forking a threaded server is unsafe
+        mp_context=multiprocessing.get_context('spawn'),
+    ) as pool:
+        return list(pool.map(_parse_segment, texts, chunksize=max(1, len(texts) // (workers * 4))))
+
+
+def _link_segment(data: t.Any, blt: C[str, Event]) -> C[str, Event]:
     events = C[str, Event](b=[blt])
 
     if data is None:
@@ -438,28 +789,781 @@ def _load_segment(text: str, blt: C[str, Event]) -> C[str, Event]:
     return events
 
 
-def _load_file(file: Path, blt: C[str, Event]) -> C[str, Event]:
-    sep = '#' * 50
-    text = file.read_text(encoding='utf-8')
+segment_sep = '#' * 50
 
-    res = C[str, Event]()
-    for part in text.split(sep):
-        res.__C_b__.append(_load_segment(part, blt))
-    return res
+
+# parsed segments of a file are cached on disk by the file's content hash;
+# entries made by another format or yaml version are ignored
+_cache_tag = f'events-v1 {_yaml_loader.__name__} yaml-{yaml.__version__}'
+
+
+@dataclasses.dataclass
+class _LoadedFile:
+    stamp: tuple[int, int]  # mtime_ns, size
+    digest: str
+    parts: list[str]
+    events: C[str, Event]
+
+
+@dataclasses.dataclass
+class _PendingFile:
+    file: Path
+    stamp: tuple[int, int]
+    digest: str
+    parts: list[str]
+    segments: list[C[str, Event] | None]  # None for parts that have to be parsed or taken from the cache
+    cached: list[t.Any] | None = None
+    parse_time: float = 0.0
 
 
-def load(p: Path) -> C[str, Event]:
-    assert p.is_dir()
-    blt_file = p / '__builtins__.yaml'
-    assert blt_file.is_file()
+@dataclasses.dataclass
+class Shadowed:
+    # a definition of `id` that lookups never find, because an earlier one is found first
+    id: str
+    file: Path
+    segment: int
+    by_file: Path
+    by_segment: int
 
-    blt = _load_file(blt_file, C())
 
-    res = C[str, Event]()
-    for file in sorted(p.rglob('*.yaml')):
-        if file == blt_file:
+@dataclasses.dataclass
+class Registry:
+    events: dict[str, Event]  # id -> the event lookups in the root find, in lookup order
+    ids: dict[Path, list[list[str]]]  # ids defined in every segment of every file, in order
+    shadowed: list[Shadowed]
+
+
+@dataclasses.dataclass(frozen=True)
+class LoadedFiles:
+    # what a `Reloader` had loaded at some point, enough for another process to load the same
+    p: Path
+    cache_dir: Path | None
+    digests: dict[Path, str]
+
+
+def build_registry(files: list[tuple[Path, C[str, Event]]]) -> Registry:
+    # `files` in lookup order, each a `C` of segments
+    events: dict[str, Event] = {}
+    where: dict[str, tuple[Path, int]] = {}
+    ids: dict[Path, list[list[str]]] = {}
+    shadowed: list[Shadowed] = []
+    for file, segments in files:
+        ids[file] = []
+        for i, segment in enumerate(segments.__C_b__):
+            ids[file].append(list(segment.__C_d__))
+            for id, event in segment.__C_d__.items():
+                if id in events:
+                    shadowed.append(Shadowed(id, file, i, *where[id]))
+                else:
+                    events[id] = event
+                    where[id] = file, i
+    return Registry(events, ids, shadowed)
+
+
+class Reloader:
+    # keeps `root` in sync with the directory: only changed files are read and only changed segments are parsed.
+    # segments only see their own events and builtins, so a changed builtins file reloads everything.
+    def __init__(self, p: Path, workers: int | None = None, cache_dir: Path | None = None):
+        assert p.is_dir()
+        self.p = p
+        self.blt_file = p / '__builtins__.yaml'
+        assert self.blt_file.is_file()
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.root = C[str, Event]()
+        self.files: dict[Path, _LoadedFile] = {}
+        # seconds spent parsing (or reading from the cache) each file during the last refresh,
+        # only for files that were parsed
+        self.parse_times: dict[Path, float] = {}
+        # flat view of `root`, rebuilt on every change
+        self.registry = Registry({}, {}, [])
+        # parse seconds of every segment of those files, None for reused segments and for files read from the cache
+        self.segment_times: dict[Path, list[float | None]] = {}
+        # wall seconds spent in each phase of the last refresh: 'read', 'cache' (reads), 'parse',
+        # 'link' (with cache writes)
+        self.phase_times: dict[str, float] = {}
+        # disk cache lookups during the last refresh
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.version = 0
+        self.refresh()
+
+    def refresh(self) -> bool:
+        self.parse_times = {}
+        self.segment_times = {}
+        self.phase_times = dict.fromkeys(['read', 'cache', 'parse', 'link'], 0.0)
+        self.cache_hits = self.cache_misses = 0
+        changed = self._refresh_files([self.blt_file], C())
+        if changed:
+            self.files = {self.blt_file: self.files[self.blt_file]}
+        blt = self.files[self.blt_file].events
+
+        paths = [
+            file
+            for file in sorted(self.p.rglob('*.yaml'))
+            if file != self.blt_file and file.name != '_.yaml'
+        ]
+        changed |= self._refresh_files(paths, blt)
+        for file in self.files.keys() - {self.blt_file, *paths}:
+            del self.files[file]
+
+        bases = [self.files[file].events for file in paths]
+        if len(bases) != len(self.root.__C_b__) or any(
+            a is not b for a, b in zip(bases, self.root.__C_b__)
+        ):
+            self.root.__C_b__[:] = bases
+            changed = True
+
+        if changed:
+            self.version += 1
+            # segments come before builtins in mros of the root
+            self.registry = build_registry(
+                [(file, self.files[file].events) for file in [*paths, self.blt_file]]
+            )
+            self._prune_cache()
+        return changed
+
+    def loaded_files(self) -> LoadedFiles:
+        return LoadedFiles(self.p, self.cache_dir, {file: f.digest for file, f in self.files.items()})
+
+    def _refresh_files(self, files: list[Path], blt: C[str, Event]) -> bool:
+        # segments whose text didn't change are reused, the rest are taken from the disk cache
+        # or parsed in one batch, and then linked in order
+        pending: list[_PendingFile] = []
+        texts: list[str] = []
+        start = time.perf_counter()
+        for file in files:
+            old = self.files.get(file)
+            stat = file.stat()
+            stamp = stat.st_mtime_ns, stat.st_size
+            if old is not None and old.stamp == stamp:
+                continue
+
+            text = file.read_text(encoding='utf-8')
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if old is not None and old.digest == digest:
+                old.stamp = stamp
+                continue
+
+            reusable: dict[str, list[C[str, Event]]] = {}
+            if old is not None:
+                for part, segment in zip(old.parts, old.events.__C_b__):
+                    reusable.setdefault(part, []).append(segment)
+
+            parts = text.split(segment_sep)
+            segments = [reusable[part].pop(0) if reusable.get(part) else None for part in parts]
+            pf = _PendingFile(file, stamp, digest, parts, segments)
+            if any(segment is None for segment in segments):
+                cache_start = time.perf_counter()
+                pf.cached = self._read_cache(digest, len(parts))
+                pf.parse_time = time.perf_counter() - cache_start
+                self.phase_times['cache'] += pf.parse_time
+                if pf.cached is None:
+                    self.cache_misses += self.cache_dir is not None
+                    texts += [part for part, segment in zip(parts, segments) if segment is None]
+                else:
+                    self.cache_hits += 1
+            pending.append(pf)
+        self.phase_times['read'] += time.perf_counter() - start - sum(pf.parse_time for pf in pending)
+
+        start = time.perf_counter()
+        parsed = iter(_parse_segments(texts, self.workers))
+        self.phase_times['parse'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for pf in pending:
+            if pf.cached is not None:
+                datas = pf.cached
+                self.segment_times[pf.file] = [None] * len(pf.parts)
+            else:
+                results = [next(parsed) if segment is None else None for segment in pf.segments]
+                datas = [r[0] if r is not None else None for r in results]
+                pf.parse_time += sum(r[1] for r in results if r is not None)
+                self.segment_times[pf.file] = [r[1] if r is not None else None for r in results]
+                # a cache entry needs every part, so it is written only when the whole file was parsed
+                if all(r is not None for r in results):
+                    self._write_cache(pf.digest, datas)
+
+            for i, segment in enumerate(pf.segments):
+                if segment is None:
+                    pf.segments[i] = _link_segment(datas[i], blt)
+            self.parse_times[pf.file] = pf.parse_time
+
+            old = self.files.get(pf.file)
+            if old is None:
+                self.files[pf.file] = _LoadedFile(
+                    pf.stamp, pf.digest, pf.parts, C[str, Event](b=pf.segments)
+                )
+            else:
+                old.stamp, old.digest, old.parts = pf.stamp, pf.digest, pf.parts
+                old.events.__C_b__[:] = pf.segments
+        self.phase_times['link'] += time.perf_counter() - start
+
+        return bool(pending)
+
+    def _read_cache(self, digest: str, num_parts: int) -> list[t.Any] | None:
+        # anything unexpected in an entry makes it a miss, it is overwritten after parsing
+        if self.cache_dir is None:
+            return None
+        try:
+            tag, cached_digest, checksum, blob = pickle.loads(
+                (self.cache_dir / f'{digest}.pickle').read_bytes()
+            )
+            if (tag, cached_digest) != (_cache_tag, digest):
+                return None
+            if hashlib.sha1(blob).hexdigest() != checksum:
+                return None
+            datas = pickle.loads(blob)
+        except Exception:
+            return None
+        if not isinstance(datas, list) or len(datas) != num_parts:
+            return None
+        return datas
+
+    def _prune_cache(self) -> None:
+        # entries of texts no file has anymore; the cache directory belongs to this directory of events
+        if self.cache_dir is None:
+            return
+        digests = {f.digest for f in self.files.values()}
+        for path in self.cache_dir.glob('*.pickle'):
+            if path.stem not in digests:
+                path.unlink(missing_ok=True)
+
+    def _write_cache(self, digest: str, datas: list[t.Any]) -> None:
+        if self.cache_dir is None:
+            return
+        blob = pickle.dumps(datas, pickle.HIGHEST_PROTOCOL)
+        entry = pickle.dumps(
+            (_cache_tag, digest, hashlib.sha1(blob).hexdigest(), blob), pickle.HIGHEST_PROTOCOL
+        )
+        path = self.cache_dir / f'{digest}.pickle'
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            tmp.write_bytes(entry)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f'Failed to write cache entry {path}: {e}')
+            tmp.unlink(missing_ok=True)
+
+
+def load(p: Path, workers: int | None = None, cache_dir: Path | None = None) -> C[str, Event]:
+    return Reloader(p, workers, cache_dir).root
+
+
+_index_key = re.compile(r'''(?:'([^']*)'|"([^"\\]*)"|([^\s#'"][^\n]*?))[ \t]*:(?:[ \t]+(?:#.*)?)?''')
+_index_bases = re.compile(r'''\$[ \t]*:[ \t]*(.*?)[ \t]*(?:#.*)?''')
+# yaml that the index doesn't follow: documents, anchors, merge keys, tags, flow or complex keys
+_index_unsure = re.compile(r'^(?:---|\.\.\.|[-{\[?&*!%@`|>])|(?:^|[ \t])(?:[&*][\w-]|![!\w<]|<<[ \t]*:)', re.M)
+
+
+def index_segment(text: str) -> tuple[list[str], dict[str, list[str] | None]] | None:
+    # top-level ids of a segment and ids of their bases, read line by line without parsing the yaml;
+    # bases are None when they aren't written as `$: $a $b` or `$: [$a, $b]`.
+    # None if the segment uses yaml this can't follow
+    if _index_unsure.search(text):
+        return None
+    ids: list[str] = []
+    bases: dict[str, list[str] | None] = {}
+    child_indent: int | None = None
+    for line in text.splitlines():
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith('#'):
             continue
-        if file.name == '_.yaml':
+        indent = len(line) - len(stripped)
+        if indent == 0:
+            m = _index_key.fullmatch(line)
+            if m is None:
+                return None
+            id = next(g for g in m.groups() if g is not None)
+            ids.append(id)
+            bases[id] = []
+            child_indent = None
             continue
-        res.__C_b__.append(_load_file(file, blt))
+        if not ids:
+            return None
+        if child_indent is None:
+            child_indent = indent
+        if indent == child_indent and (m := _index_bases.fullmatch(stripped)):
+            value = m[1].strip('\'"')
+            if value.startswith('[') and value.endswith(']'):
+                bases[ids[-1]] = [x.strip().strip('\'"') for x in value[1:-1].split(',') if x.strip()]
+            elif value:
+                bases[ids[-1]] = value.split()
+            else:
+                bases[ids[-1]] = None
+    return ids, bases
+
+
+@dataclasses.dataclass
+class _LazySegment:
+    file: Path
+    events: C[str, Event]  # of the file the segment is in
+    pos: int  # of the segment in the file
+    text: str
+    ids: list[str] | None  # None if unknown before parsing
+    bases: dict[str, list[str] | None]
+    parsed: bool = False
+
+
+class LazyEvents(C[str, Event]):
+    # a root like the one `load` returns, but segments are parsed when one of their ids is first looked up,
+    # using an index of ids made by `index_segment`; iterating over it parses everything.
+    # unparsed segments are empty placeholders inheriting builtins, so the mro has the usual shape
+    __slots__ = ('__C_l__',)
+    __C_l__: _LazyLoader
+
+    def __init__(self, p: Path):
+        super().__init__()
+        object.__setattr__(self, '__C_l__', _LazyLoader(p, self))
+
+    def _lookup[D](self, key: str, default: D) -> Event | D:
+        # parsing swaps placeholders in bases of files, so the walk over the mro can't run alongside it
+        with self.__C_l__.lock:
+            self.__C_l__.require(key)
+            return super()._lookup(key, default)
+
+    def items(self):
+        self.__C_l__.require_all()
+        return super().items()
+
+    def bases_of(self, id: str) -> list[str] | None:
+        # ids of the bases of `id` from the index, without parsing; None if unknown
+        for segment in self.__C_l__.by_id.get(id, []):
+            return segment.bases.get(id)
+        return None
+
+
+class _LazyLoader:
+    def __init__(self, p: Path, root: C[str, Event]):
+        assert p.is_dir()
+        self.lock = threading.RLock()
+        self.blt = _link_segment(_parse_segment((p / '__builtins__.yaml').read_text(encoding='utf-8'))[0], C())
+        self.segments: list[_LazySegment] = []
+        self.by_id: dict[str, list[_LazySegment]] = {}
+        # false once a parsed segment didn't match its index, then everything is parsed
+        self.exact = True
+
+        files = []
+        for file in sorted(p.rglob('*.yaml')):
+            if file == p / '__builtins__.yaml' or file.name == '_.yaml':
+                continue
+            parts = file.read_text(encoding='utf-8').split(segment_sep)
+            events = C[str, Event](b=[C[str, Event](b=[self.blt]) for _ in parts])
+            files.append(events)
+            for pos, part in enumerate(parts):
+                index = index_segment(part)
+                segment = _LazySegment(file, events, pos, part, *(index or (None, {})))
+                self.segments.append(segment)
+                for id in segment.ids or []:
+                    self.by_id.setdefault(id, []).append(segment)
+        root.__C_b__ = files
+
+        for segment in self.segments:
+            if segment.ids is None:
+                self.parse(segment)
+
+    def parse(self, segment: _LazySegment) -> None:
+        if segment.parsed:
+            return
+        data = _parse_segment(segment.text)[0]
+        if segment.ids is not None and list(data or {}) != segment.ids:
+            print(f'index of segment {segment.pos} of {segment.file} is wrong, loading everything')
+            self.exact = False
+        segment.events.__C_b__[segment.pos] = _link_segment(data, self.blt)
+        segment.parsed = True
+
+    def require(self, id: str) -> None:
+        # parses segments defining `id` until the one that wins lookups is parsed
+        with self.lock:
+            for segment in self.by_id.get(id, []):
+                self.parse(segment)
+                if id in segment.events.__C_b__[segment.pos].__C_d__:
+                    break
+            if not self.exact:
+                self.require_all()
+
+    def require_all(self) -> None:
+        with self.lock:
+            for segment in self.segments:
+                self.parse(segment)
+
+
+def freeze(
+    events: C[str, Event] | t_abc.Mapping[str, Event],
+    errors: list[DisplayError] | None = None,
+) -> C[str, FrozenEvent]:
+    # flattens loaded events (a root or `Registry.events`) into `FrozenEvent`s and the root into a single-level `C`
+    # events without a valid mro are left out and reported to `errors`, so the others are still served
+    items = []
+
+    # mros are linearized here instead of being cached on the live events, where they would stay with the tree
+    mros: dict[int, list[Event]] = {}
+    frozen: dict[int, tuple[Event, FrozenEvent]] = {}
+    for k, event in events.items():
+        try:
+            mro = c3(event, lambda x: x.__C_b__, mros)
+        except TypeError as exc:
+            if errors is not None:
+                import traceback
+
+                errors.append(DisplayError(k, exc.__class__.__qualname__, str(exc), traceback.format_exc()))
+            continue
+        items.append((k, event))
+        for e in mro:
+            if id(e) not in frozen:
+                frozen[id(e)] = e, object.__new__(FrozenEvent)
+
+    # key positions, one dict for every distinct order of keys
+    layouts: dict[tuple[str, ...], dict[str, int]] = {}
+    for e, f in frozen.values():
+        attrs: dict[str, t.Any] = {}
+        for c in mros[id(e)]:
+            for k, v in c.__C_d__.items():
+                attrs.setdefault(k, v)
+        keys = tuple(attrs)
+        if (index := layouts.get(keys)) is None:
+            index = layouts[keys] = {k: i for i, k in enumerate(keys)}
+        object.__setattr__(f, '__C_d__', FrozenAttrs(index, tuple(attrs.values())))
+        object.__setattr__(f, '__C_o__', e.__C_d__)
+        object.__setattr__(f, '__C_b__', tuple(frozen[id(b)][1] for b in e.__C_b__))
+        object.__setattr__(f, '__C_m__', None)
+        object.__setattr__(f, '__C_g__', -1)
+
+    children: dict[int, dict[int, FrozenEvent]] = {id(f): {} for _, f in frozen.values()}
+    for _, f in frozen.values():
+        for b in f.__C_b__:
+            children[id(b)][id(f)] = f
+    for _, f in frozen.values():
+        object.__setattr__(f, '__C_c__', tuple(children[id(f)].values()))
+
+    return C[str, FrozenEvent]({k: frozen[id(event)][1] for k, event in items})
+
+
+@dataclasses.dataclass
+class DisplayError:
+    id: str
+    type: str
+    message: str
+    traceback: str
+
+
+# events are displayed in worker processes only when there are this many: starting the pool costs tens of ms,
+# and sending rows back costs workers and this process about a quarter of what displaying them does
+parallel_display_threshold = 5000
+
+
+type Displayed = tuple[list[tuple[str, dict[str, t.Any]]], list[DisplayError]]
+
+
+def _display(events: t_abc.Sequence[tuple[str, Event]], debug: bool) -> Displayed:
+    import traceback
+
+    timestamps = get_timestamps(e for _, e in events)
+    rows = []
+    errors = []
+    for id, e in events:
+        try:
+            rows.append((id, e.display(debug, timestamps)))
+        except Exception as exc:
+            errors.append(DisplayError(id, exc.__class__.__qualname__, str(exc), traceback.format_exc()))
+    return rows, errors
+
+
+# events being displayed, forked workers inherit them instead of loading them
+_fork_events: list[tuple[str, Event]] = []
+
+
+def _display_range(start: int, stop: int, debug: bool) -> Displayed:
+    return _display(_fork_events[start:stop], debug)
+
+
+def display_events(events: list[tuple[str, Event]], debug: bool = False, workers: int = 1) -> Displayed:
+    # displayed rows of events that could be displayed and errors of the rest, in the order of `events`.
+    # with enough events they are split between forked worker processes that share them with this one
+    # (only rows are sent back); forking is safe only while this process has no other threads, so a threaded
+    # server displays everything itself. if anything goes wrong in workers, everything is displayed here
+    import multiprocessing
+
+    if (
+        workers <= 1
+        or len(events) < parallel_display_threshold
+        or threading.active_count() > 1
+        or 'fork' not in multiprocessing.get_all_start_methods()
+    ):
+        return _display(events, debug)
+
+    import concurrent.futures
+    import gc
+    import itertools
+
+    global _fork_events
+    size = max(1, len(events) // (workers * 4))
+    starts = range(0, len(events), size)
+    _fork_events = events
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context('fork'),
+            # collections would touch (and copy) every inherited object, workers are short-lived
+            initializer=gc.disable,
+        ) as pool:
+            results = list(
+                pool.map(_display_range, starts, [start + size for start in starts], itertools.repeat(debug))
+            )
+    except Exception as e:
+        print(f'Failed to display events in worker processes: {e!r}')
+        return _display(events, debug)
+    finally:
+        _fork_events = []
+
+    rows = [row for r in results for row in r[0]]
+    errors = [error for r in results for error in r[1]]
+    return rows, errors
+
+
+def normalize(events: C[str, Event]) -> dict[str, t.Any]:
+    # every event once, with its own attributes and keys of its bases, instead of all attributes of every event:
+    # {"ids": [ids in lookup order], "events": {key: {"own": {...}, "bases": [keys]}}}.
+    # keys are ids, except for events shadowed by another event with the same id, those get `id#2`, `id#3`, ...
+    keys: dict[int, str] = {}
+
+    def key(e: Event) -> str:
+        if id(e) not in keys:
+            k, n = e.id, 1
+            while k in used:
+                n += 1
+                k = f'{e.id}#{n}'
+            keys[id(e)] = k
+            used.add(k)
+        return keys[id(e)]
+
+    used: set[str] = set()
+    queue = [e for _, e in events.items()]
+    ids = [key(e) for e in queue]
+    res: dict[str, dict[str, t.Any]] = {}
+    for e in queue:
+        if key(e) in res:
+            continue
+        res[key(e)] = {
+            'own': dump(e._own()),
+            'bases': [key(b) for b in e.__C_b__],
+        }
+        queue += e.__C_b__
+    return {'ids': ids, 'events': res}
+
+
+def rebuild(normalized: dict[str, t.Any]) -> dict[str, dict[str, t.Any]]:
+    # {id: all attributes} from what `normalize` gives, in the same order as `dump` of every event
+    events: dict[str, dict[str, t.Any]] = normalized['events']
+    # c3 tells nodes apart by identity, so every key is the same str object
+    canonical = {k: k for k in events}
+    memo: dict[int, list[str]] = {}
+    res: dict[str, dict[str, t.Any]] = {}
+    for k in normalized['ids']:
+        d: dict[str, t.Any] = {}
+        for base in c3(canonical[k], lambda x: [canonical[b] for b in events[x]['bases']], memo):
+            for attr, v in events[base]['own'].items():
+                if attr not in d:
+                    d[attr] = v
+        res[k] = d
     return res
+
+
+def test_timestamps(p: Path) -> bool:
+    def reference(d: t.Any) -> float | None:
+        # the original straightforward parser, `get_timestamp` must agree with it on everything
+        match d:
+            case [*_]:
+                return statistics.mean([reference(x) for x in d if reference(x)])
+            case {'moment': moment}:
+                return reference(moment)
+            case {'start': start, 'end': end}:
+                match reference(start), reference(end):
+                    case None, None:
+                        return None
+                    case None, f:
+                        return f
+                    case f, None:
+                        return f
+                    case f1, f2:
+                        return (f1 + f2) / 2
+            case int():
+                return reference(str(d))
+            case float():
+                return reference(str(d)) or reference('0' + str(d))
+            case str():
+                d = d.strip()
+                if '-' in d:
+                    start, _, end = d.partition('-')
+                    return reference({'start': start.strip(), 'end': end.strip()})
+                for fmt in allowed_time_formats:
+                    try:
+                        return time.mktime(time.strptime(d, fmt))
+                    except ValueError:
+                        pass
+                return None
+            case _:
+                return None
+
+    def check(d: t.Any) -> None:
+        try:
+            expected = reference(d)
+        except Exception as e:
+            expected = type(e)
+        try:
+            got = get_timestamp(d)
+        except Exception as e:
+            got = type(e)
+        assert got == expected, (d, got, expected)
+
+    # fmt: off
+    corpus: list[t.Any] = [
+        '2024', ' 2024 ', '05.06.2024', '5.6.2024', '05.06.2024 10:30', '10:30 05.06.2024', '10:30  5.06.2024',
+        '06.2024', '6.2024', '31.02.2024', '13.2024', '24:00 01.01.2024', '2024-2025', '01.01.2024 - 02.02.2024',
+        '01.2024-02.2024', '1-2-3', '-', '', 'январь', 'ноябрь-март', '2024?', 'x.10.2008 - x.10.2008',
+        2024, 5.2024, 10.2024, 1.1, True, None, [], [{'moment': 'январь'}],
+    ]
+    # fmt: on
+    events = load(p)
+    for _, e in events.items():
+        corpus.append(e.date)
+        match e.date:
+            case [*xs]:
+                corpus += xs
+            case {**parts}:
+                corpus += parts.values()
+    for d in corpus:
+        check(d)
+
+    expected = {}
+    for _, e in events.items():
+        try:
+            expected[e.id] = reference(e.date)
+        except Exception:
+            pass
+    assert get_timestamps(e for _, e in events.items()) == expected
+
+    return True
+
+
+def test_grades() -> bool:
+    for s, dumped in [
+        ('5', '5'), ('5-11', '5-11'), ('11,5-9', '5-9,11'), ('1,2,3', '1-3'), ('0-63', '0-63'), ('7-6', ''),
+    ]:
+        g = parse_grades(s)
+        assert dump_grades(g) == dumped, (s, dump_grades(g), dumped)
+        assert parse_grades(dumped) == g if dumped else g == 0
+        assert list(g) == sorted(set(g)) and len(g) == len(list(g))
+
+    g = parse_grades('5-9,11')
+    assert g.covers(5, 9) and g.covers(6, 8) and g.covers(11, 11) and g.covers(9, 8)
+    assert not g.covers(5, 11) and not g.covers(4, 5)
+    assert g.intersects(parse_grades('1-5')) and not g.intersects(parse_grades('10,12-20'))
+    assert 11 in g and 10 not in g and -1 not in g and dump(g) == [5, 6, 7, 8, 9, 11]
+    return True
+
+
+def test_lazy(p: Path) -> bool:
+    events = load(p)
+    for k, e in events.items():
+        # a fresh root every time, so only what `k` needs is parsed
+        assert LazyEvents(p)[k].dump() == e.dump(), k
+
+    # yaml the index can't follow line by line
+    for text in [
+        '$a: &a\n  name_0: x\nb:\n  <<: *a\n',
+        'a:\n  <<: {$: $b}\n',
+        'a:\n  $: !!str $b\n',
+        'a: !!map\n  name_0: x\n',
+        'a:\n  name_0: x\n---\nb:\n  name_0: y\n',
+        '%YAML 1.2\n---\na:\n  name_0: x\n',
+        'a:\n  name_0: x\n...\n',
+        '{a: {name_0: x}}\n',
+        '? a\n: {name_0: x}\n',
+        '[a, b]:\n  name_0: x\n',
+        '- a\n- b\n',
+        'a: 1\n',
+        'a: |\n  text\n',
+        '  a:\n    name_0: x\n',
+    ]:
+        assert index_segment(text) is None, text
+    assert index_segment('a:\n  $: $b $c  # bases\nb:\n  $: [$c]\n') == (['a', 'b'], {'a': ['$b', '$c'], 'b': ['$c']})
+    return True
+
+
+def test_reload(p: Path) -> bool:
+    import shutil
+    import tempfile
+
+    def check(r: Reloader) -> None:
+        expected = load(r.p, workers=1)
+        assert [(k, e.dump()) for k, e in r.root.items()] == [(k, e.dump()) for k, e in expected.items()]
+        assert r.cache_dir is not None
+        # files parsed only in part have no entry
+        assert {f.stem for f in r.cache_dir.glob('*.pickle')} <= {f.digest for f in r.files.values()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        events = Path(tmp) / 'events'
+        cache_dir = Path(tmp) / 'cache'
+        shutil.copytree(p, events)
+        r = Reloader(events, workers=1, cache_dir=cache_dir)
+        check(r)
+        files = sorted(f for f in events.glob('*.yaml') if f.name not in ('__builtins__.yaml', '_.yaml'))
+
+        # an edited event
+        text = files[0].read_text(encoding='utf-8')
+        files[0].write_text(re.sub(r'^  date: .*$', '  date: 01.01.2001', text, count=1, flags=re.M), encoding='utf-8')
+        assert r.refresh()
+        check(r)
+
+        # an appended segment
+        text = files[1].read_text(encoding='utf-8')
+        files[1].write_text(f'{text}\n{segment_sep}\ntest_reload:\n  name_0: x\n', encoding='utf-8')
+        assert r.refresh() and 'test_reload' in r.root
+        check(r)
+
+        # a deleted file, its cache entry goes too
+        files[2].unlink()
+        assert r.refresh()
+        check(r)
+        assert not r.refresh()
+
+        # a corrupt cache entry is a miss, the file is parsed again and the entry rewritten
+        cached = [file for file, f in r.files.items() if (cache_dir / f'{f.digest}.pickle').exists()]
+        assert files[3] in cached
+        entry = cache_dir / f'{r.files[files[3]].digest}.pickle'
+        entry.write_bytes(entry.read_bytes()[:-10])
+        r = Reloader(events, workers=1, cache_dir=cache_dir)
+        assert r.cache_hits == len(cached) - 1
+        check(r)
+        r = Reloader(events, workers=1, cache_dir=cache_dir)
+        assert r.cache_hits == len(r.files)
+
+        # a change to builtins reloads everything
+        r.blt_file.write_text(r.blt_file.read_text(encoding='utf-8') + '\n# changed\n', encoding='utf-8')
+        assert r.refresh()
+        check(r)
+    return True
+
+
+def test_normalize(p: Path) -> bool:
+    import json
+
+    events = load(p)
+    for data in (events, freeze(events)):
+        normalized = json.loads(json.dumps(normalize(data)))
+        expected = {k: e.dump() for k, e in data.items()}
+        assert json.dumps(rebuild(normalized)) == json.dumps(expected)
+    return True
+
+
+if __name__ == '__main__':
+    assert test_grades()
+    assert test_timestamps(Path(__file__).parent / 'events')
+    assert test_lazy(Path(__file__).parent / 'events')
+    assert test_reload(Path(__file__).parent / 'events')
+    assert test_normalize(Path(__file__).parent / 'events')
+    print('ok')
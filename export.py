@@ -0,0 +1,130 @@
+'''
+python3.12 export.py site
+python3.12 export.py site --incremental
+
+writes the site as static files with precompressed .gz siblings (nginx: `gzip_static on;`),
+the page filters and sorts rows itself there
+'''
+
+from __future__ import annotations
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import collections.abc as t_abc
+from pathlib import Path
+
+from flask import render_template
+
+import main as app
+
+
+static_urls = {
+    'index': 'index.html',
+    'about': 'about.html',
+    'raw': 'raw.json',
+    'columns': 'columns.json',
+    'data': 'data.json',
+    'orders': 'orders.json',
+}
+
+# code that shapes the outputs, a change to it rebuilds everything
+sources = ['c3.py', 'event.py', 'facets.py', 'main.py', 'export.py']
+
+# digests of the inputs of every output, as of when it was written
+manifest_name = '.export.json'
+
+
+def digest(inputs: list[bytes]) -> str:
+    h = hashlib.sha256()
+    for x in inputs:
+        h.update(hashlib.sha256(x).digest())
+    return h.hexdigest()
+
+
+def events_digest() -> bytes:
+    files = app.dataset().files
+    return json.dumps(sorted((f.relative_to(files.p).as_posix(), d) for f, d in files.digests.items())).encode()
+
+
+def outputs() -> dict[str, tuple[list[bytes], t_abc.Callable[[], bytes]]]:
+    # name -> (inputs, build)
+    code = [(app.dir_this / name).read_bytes() for name in sources]
+    events = [events_digest()]
+    client = app.app.test_client()
+
+    def get(url: str) -> bytes:
+        response = client.get(url, headers={'Accept-Encoding': 'identity'})
+        assert response.status_code == 200, (url, response.status)
+        return response.get_data()
+
+    def template(name: str) -> bytes:
+        return (app.dir_templates / name).read_bytes()
+
+    def render(name: str) -> bytes:
+        with app.app.app_context():
+            return render_template(name, urls=static_urls, static=True).encode('utf8')
+
+    def build_orders() -> bytes:
+        return json.dumps(app.derive('facets', app.build_facets).orders).encode('utf8')
+
+    return {
+        'index.html': ([*code, template('index.html')], lambda: render('index.html')),
+        'about.html': ([*code, template('about.html')], lambda: render('about.html')),
+        'columns.json': (code, lambda: get('/columns')),
+        'data.json': ([*code, *events], lambda: get('/data.json')),
+        'orders.json': ([*code, *events], build_orders),
+        'raw.json': ([*code, *events], lambda: get('/raw.json')),
+        'graph.dot': ([*code, *events], lambda: get('/graph.dot')),
+    }
+
+
+def write(path: Path, body: bytes) -> None:
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+
+
+def export(out: Path, incremental: bool = False) -> list[str]:
+    # returns names of the outputs that were written
+    out.mkdir(parents=True, exist_ok=True)
+    manifest: dict[str, str] = {}
+    if incremental:
+        try:
+            manifest = json.loads((out / manifest_name).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            pass
+
+    written = []
+    for name, (inputs, build) in outputs().items():
+        d = digest(inputs)
+        if (
+            incremental
+            and manifest.get(name) == d
+            and (out / name).is_file()
+            and (out / f'{name}.gz').is_file()
+        ):
+            continue
+        body = build()
+        write(out / name, body)
+        write(out / f'{name}.gz', gzip.compress(body, 9, mtime=0))
+        manifest[name] = d
+        written.append(name)
+
+    write(out / manifest_name, json.dumps(manifest, indent=2).encode('utf8'))
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='writes the site as static files')
+    parser.add_argument('out', type=Path)
+    parser.add_argument('--incremental', action='store_true', help='rewrite only outputs whose inputs changed')
+    args = parser.parse_args()
+
+    written = export(args.out, args.incremental)
+    print(f'wrote {", ".join(written) or "nothing"} to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import json
+import typing as t
+import collections.abc as t_abc
+
+from event import Event, junk
+
+
+# field -> values of an event for it
+fields: dict[str, t_abc.Callable[[Event], t_abc.Iterable[t.Any]]] = {
+    'grade': lambda e: e.grades or [None],
+    'discipline': lambda e: [e.discipline],
+    'format': lambda e: [e.format],
+    'rating': lambda e: [e.rating],
+    'diff': lambda e: [e.diff],
+    'stage': lambda e: [e.stage],
+    'meta': lambda e: [e.id.startswith('$')],
+}
+
+
+def key(value: t.Any) -> str:
+    # how a value is spelled in query strings and facet counts
+    match value:
+        case bool():
+            return '1' if value else '0'
+        case None:
+            return ''
+        case _ if value is junk:
+            return ''
+        case _:
+            return str(value)
+
+
+def mask(indices: t_abc.Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def indices(mask: int) -> list[int]:
+    return [i for i, c in enumerate(reversed(bin(mask)[2:])) if c == '1']
+
+
+def sort_key(value: t.Any) -> tuple[int, t.Any]:
+    # numbers before strings before anything else, so columns with mixed keys still sort
+    match value:
+        case bool() | int() | float():
+            return 0, value
+        case str():
+            return 1, value
+        case _:
+            return 2, json.dumps(value, sort_keys=True)
+
+
+def sort_orders(rows: list[tuple[Event, dict[str, t.Any]]]) -> dict[str, dict[str, list[int]]]:
+    # for every sortable column, positions of rows ordered by their sort keys ('asc' and 'desc');
+    # rows without a key go last in both, equal keys keep the order of rows
+    res: dict[str, dict[str, list[int]]] = {}
+    for column in Event.table_columns:
+        if not column['sortable']:
+            continue
+        keys = [(i, row[column['id']]['sort_key']) for i, (_, row) in enumerate(rows)]
+        present = [(i, sort_key(k)) for i, k in keys if k is not None]
+        missing = [i for i, k in keys if k is None]
+        res[column['id']] = {
+            'asc': [i for i, _ in sorted(present, key=lambda x: x[1])] + missing,
+            'desc': [i for i, _ in sorted(present, key=lambda x: x[1], reverse=True)] + missing,
+        }
+    return res
+
+
+class FacetIndex:
+    # inverted indexes over displayed rows: for every field and value, a bitmask of rows that have it
+    def __init__(self, rows: list[tuple[Event, dict[str, t.Any]]]):
+        self.size = len(rows)
+        self.rows = [json.dumps(row) for _, row in rows]
+        self.ids = [e.id for e, _ in rows]
+        self.positions = {id: i for i, id in enumerate(self.ids)}
+
+        postings: dict[str, dict[str, list[int]]] = {field: {} for field in fields}
+        for i, (e, _) in enumerate(rows):
+            for field, values in fields.items():
+                for value in values(e):
+                    postings[field].setdefault(key(value), []).append(i)
+        self.postings = {
+            field: {k: mask(ids, self.size) for k, ids in values.items()}
+            for field, values in postings.items()
+        }
+        self.orders = sort_orders(rows)
+
+    def ids_mask(self, ids: t_abc.Iterable[str]) -> int:
+        return mask((self.positions[id] for id in ids if id in self.positions), self.size)
+
+    def ids_of(self, m: int) -> list[str]:
+        return [self.ids[i] for i in indices(m)]
+
+    def ordered(self, m: int, order: list[int] | None = None) -> list[int]:
+        # positions of rows in `m`, in `order` (one of `orders`) or in the order of rows
+        if order is None:
+            return indices(m)
+        found = set(indices(m))
+        return [i for i in order if i in found]
+
+    def dump(self, positions: t_abc.Iterable[int]) -> str:
+        return f'[{", ".join(self.rows[i] for i in positions)}]'
+
+    def _masks(self, filters: dict[str, list[str]]) -> dict[str, int]:
+        masks: dict[str, int] = {}
+        for field, values in filters.items():
+            if field in self.postings and values:
+                masks[field] = 0
+                for value in values:
+                    masks[field] |= self.postings[field].get(value, 0)
+        return masks
+
+    def match(self, filters: dict[str, list[str]]) -> int:
+        matched = (1 << self.size) - 1
+        for m in self._masks(filters).values():
+            matched &= m
+        return matched
+
+    def query(
+        self,
+        filters: dict[str, list[str]],
+        offset: int = 0,
+        limit: int | None = None,
+        within: int | None = None,
+        extra: dict[str, t.Any] | None = None,
+        order: list[int] | None = None,
+    ) -> str:
+        # `within` restricts returned rows (but not facet counts), `extra` is added to the response,
+        # rows are returned in `order`
+        everything = (1 << self.size) - 1
+        masks = self._masks(filters)
+        matched = self.match(filters)
+        if within is not None:
+            matched &= within
+
+        # counts for a field ignore the filter on that field, so they show what selecting another value gives
+        facets: dict[str, dict[str, int]] = {}
+        for field, postings in self.postings.items():
+            base = everything
+            for other, m in masks.items():
+                if other != field:
+                    base &= m
+            facets[field] = {k: (base & p).bit_count() for k, p in postings.items()}
+
+        found = self.ordered(matched, order)
+        page = found[offset:] if limit is None else found[offset : offset + max(0, limit)]
+        head = json.dumps(
+            {'total': len(found), 'offset': offset, 'limit': limit, 'facets': facets} | (extra or {})
+        )
+        return f'{head[:-1]}, "rows": {self.dump(page)}}}'
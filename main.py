@@ -15,46 +15,282 @@ import sys
 from pathlib import Path
 import gzip
 import json
-import functools
+import collections
+import dataclasses
+import hashlib
+import datetime
+import os
+import threading
+import time
+import zlib
+import typing as t
+import collections.abc as t_abc
 
-from flask import Flask, jsonify, render_template, make_response
+from flask import Flask, Response, abort, g, has_app_context, render_template, make_response, request
 
-from event import load, Event
+from c3 import C, dump
+from event import (
+    Reloader,
+    Registry,
+    LoadedFiles,
+    LazyEvents,
+    FrozenEvent,
+    freeze,
+    descendants,
+    display_events,
+    DisplayError,
+    normalize,
+    get_timestamp,
+    Event,
+    Grades,
+)
+from facets import FacetIndex, fields as facet_fields
+from timeline import TimeIndex, Occurrence, ics
+import metrics
 
 dir_this = Path(__file__).parent
 dir_events = dir_this / 'events'
 dir_templates = dir_this / 'templates'
+dir_cache = dir_this / '.cache'
 
 
 DEBUG = '--debug' in sys.argv
+# check `events/` for changes on every request and reload only what changed
+WATCH = DEBUG or '--watch' in sys.argv
+# count lookups and linearizations for /metrics, this slows every lookup down
+METRICS = '--metrics' in sys.argv
+# --refresh <seconds>: also check `events/` for changes in the background this often (SIGHUP does it right away)
+REFRESH = float(sys.argv[sys.argv.index('--refresh') + 1]) if '--refresh' in sys.argv else None
+
+if METRICS:
+    metrics.instrument()
 
 app = Flask(__name__)
 
 
-@(lambda x: x) if DEBUG else functools.cache
-def load_data():
-    return load(dir_events)
+def print_parse_times(r: Reloader) -> None:
+    for file, parse_time in sorted(r.parse_times.items(), key=lambda x: -x[1]):
+        print(f'parsed {file.relative_to(r.p)} in {parse_time * 1000:.1f} ms')
+
+
+def record_load(r: Reloader) -> None:
+    print_parse_times(r)
+    metrics.reloads.inc()
+    for phase, seconds in r.phase_times.items():
+        metrics.load_phase_seconds.set(seconds, phase=phase)
+    for file, parse_time in r.parse_times.items():
+        name = file.relative_to(r.p).as_posix()
+        metrics.file_parse_seconds.set(parse_time, file=name)
+        for i, seconds in enumerate(r.segment_times.get(file, [])):
+            if seconds is not None:
+                metrics.segment_parse_seconds.set(seconds, file=name, segment=i)
+    metrics.load_cache.inc(r.cache_hits, result='hit')
+    metrics.load_cache.inc(r.cache_misses, result='miss')
+    metrics.shadowed_ids.set(len(r.registry.shadowed))
+    for s in r.registry.shadowed:
+        print(
+            f'{s.id} in {s.file.relative_to(r.p)} (segment {s.segment}) is shadowed by '
+            f'{s.by_file.relative_to(r.p)} (segment {s.by_segment})'
+        )
+
+
+@dataclasses.dataclass
+class Dataset:
+    # everything requests need from one load of `events/`; after it is published only `derived` grows
+    version: int
+    data: C[str, FrozenEvent]
+    registry: Registry
+    files: LoadedFiles
+    # events left out by `freeze`, reported with the ones that fail to display
+    errors: list[DisplayError]
+    # objects built from `data` by `derive`, and locks that make each of them built once
+    derived: dict[str, t.Any] = dataclasses.field(default_factory=dict)
+    building: dict[str, threading.Lock] = dataclasses.field(default_factory=dict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+
+# the published dataset, replaced as a whole: a request sees either the old one or the new one
+_dataset: Dataset | None = None
+# the loader of `events/`, touched only with `_load_lock` held, so one thread loads at a time
+_reloader: Reloader | None = None
+_load_lock = threading.Lock()
+# the dataset being prepared by this thread, before it is published
+_pinned = threading.local()
+
+
+def publish(d: Dataset) -> None:
+    global _dataset
+    _dataset = d
+    metrics.dataset_version.set(d.version)
+    metrics.dataset_events.set(len(d.data.__C_d__))
+
+
+def refresh(wait: bool = True, prepare: bool = False) -> bool:
+    # reads what changed in `events/` and publishes it as a new dataset, True if anything did.
+    # without `wait` gives up if another thread is loading; with `prepare` what `warm` asks for is built
+    # before the dataset is published, so requests don't wait for it
+    global _reloader
+    if not _load_lock.acquire(blocking=wait):
+        return False
+    try:
+        r = _reloader
+        if r is None:
+            r = Reloader(dir_events, cache_dir=dir_cache)
+        elif not r.refresh() and _dataset is not None and _dataset.version == r.version:
+            return False
+        record_load(r)
+        errors: list[DisplayError] = []
+        with metrics.freeze_seconds.timer():
+            data = freeze(r.registry.events, errors)
+        d = Dataset(r.version, data, r.registry, r.loaded_files(), errors)
+        if prepare:
+            _pinned.dataset = d
+            try:
+                warm()
+            finally:
+                del _pinned.dataset
+        publish(d)
+        # kept only once what it loaded is published: if loading fails before that, the next call starts over
+        # (or, for a loader that already read the change, publishes it again)
+        _reloader = r
+        return True
+    finally:
+        _load_lock.release()
+
+
+def unload() -> None:
+    # forgets everything loaded, the next request loads `events/` from scratch (the disk cache is kept)
+    global _dataset, _reloader
+    with _load_lock:
+        _dataset = _reloader = None
+
+
+def current_dataset() -> Dataset:
+    if WATCH:
+        refresh(wait=False)
+    while _dataset is None:
+        # raises what went wrong if `events/` can't be loaded
+        refresh()
+    return _dataset
+
+
+def dataset() -> Dataset:
+    # the dataset published when the current request first asked for it, so it is the same for the whole request
+    if (d := getattr(_pinned, 'dataset', None)) is not None:
+        return d
+    if not has_app_context():
+        return current_dataset()
+    if 'dataset' not in g:
+        g.dataset = current_dataset()
+    return g.dataset
+
+
+def load_data() -> C[str, FrozenEvent]:
+    return dataset().data
+
+
+_lazy: LazyEvents | None = None
+_lazy_lock = threading.Lock()
+
+
+def lazy_data() -> LazyEvents:
+    # indexed once, even if a burst of first requests asks for it
+    global _lazy
+    with _lazy_lock:
+        if _lazy is None:
+            _lazy = LazyEvents(dir_events)
+    return _lazy
+
+
+def loaded_or_lazy_data():
+    # the dataset if it is loaded, otherwise a root that parses only the segments that are looked up
+    if WATCH or _dataset is not None:
+        return load_data()
+    return lazy_data()
+
+
+# urls the pages use, relative so the site works under any prefix; `export.py` renders them with its own
+server_urls = {'index': '.', 'about': 'about', 'raw': 'raw.json', 'columns': 'columns', 'query': 'query'}
 
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', urls=server_urls, static=False)
 
 
 @app.route('/about')
 def about():
-    return render_template('about.html')
+    return render_template('about.html', urls=server_urls, static=False)
+
+def graph_events(data, root: str | None) -> list[Event]:
+    # all events, or `root` and its descendants
+    if root is None:
+        return [e for _, e in data.items()]
+    if root not in data:
+        abort(404)
+    return [data[root], *descendants(data[root])]
+
+
+def graph_edges(events: list[Event], closed: bool) -> list[tuple[Event, Event]]:
+    # (base, event) pairs; if `closed`, only those with both ends in `events`
+    ids = {id(e) for e in events}
+    return [
+        (base, e)
+        for e in events
+        for base in e.__C_b__
+        if not closed or id(base) in ids
+    ]
+
+
+def build_dot(data, root: str | None = None) -> str:
+    edges = graph_edges(graph_events(data, root), closed=root is not None)
+    res = ''.join(f'"{base.id}" -> "{e.id}";\n' for base, e in edges)
+    return f'digraph G {{ {res} }}'
+
+
+def build_adjacency(data, root: str | None = None) -> dict[str, dict[str, list[str]]]:
+    return {
+        e.id: {
+            'parents': [base.id for base in e.__C_b__],
+            'children': [child.id for child in e._children()],
+        }
+        for e in graph_events(data, root)
+    }
+
+
+@app.route('/graph.dot')
+def get_graph_dot():
+    # /graph.dot?root=$vseros for the subtree of one event
+    if (root := request.args.get('root')) is not None:
+        response = make_response(build_dot(load_data(), root))
+        response.mimetype = 'text/vnd.graphviz'
+        return response
+    return send_payload(
+        get_payload('graph.dot', 'text/vnd.graphviz', lambda data: build_dot(data).encode('utf8'))
+    )
+
+
+@app.route('/graph.json')
+def get_graph_json():
+    # {id: {"parents": [...], "children": [...]}}, /graph.json?root=$vseros for the subtree of one event
+    if (root := request.args.get('root')) is not None:
+        response = make_response(json.dumps(build_adjacency(load_data(), root), ensure_ascii=False))
+        response.mimetype = 'application/json'
+        return response
+    return send_payload(
+        get_payload(
+            'graph.json',
+            'application/json',
+            lambda data: json.dumps(build_adjacency(data), ensure_ascii=False).encode('utf8'),
+        )
+    )
+
 
 @app.route('/graph')
 def get_graph():
     import urllib.parse
 
-    res = ''
-    for id, e in load_data().items():
-        for base in e.__C_b__:
-            res += f'"{base.id}" -> "{e.id}";\n'
-    # print(res)
-    res = f'digraph G {{ {res} }}'
+    res = derive('graph', build_dot)
     url = f'https://dreampuf.github.io/GraphvizOnline/?engine=fdp#{urllib.parse.quote(res)}'
     return f'<a href="{url}">-> see graph</a>'
     # https://dreampuf.github.io/GraphvizOnline/?engine=fdp#digraph%20G%20%7B%0A%0A%20%20subgraph%20cluster_0%20%7B%0A%20%20%20%20style%3Dfilled%3B%0A%20%20%20%20color%3Dlightgrey%3B%0A%20%20%20%20node%20%5Bstyle%3Dfilled%2Ccolor%3Dwhite%5D%3B%0A%20%20%20%20a0%20-%3E%20a1%20-%3E%20a2%20-%3E%20a3%3B%0A%20%20%20%20label%20%3D%20%22process%20%231%22%3B%0A%20%20%7D%0A%0A%20%20subgraph%20cluster_1%20%7B%0A%20%20%20%20node%20%5Bstyle%3Dfilled%5D%3B%0A%20%20%20%20b0%20-%3E%20b1%20-%3E%20b2%20-%3E%20b3%3B%0A%20%20%20%20label%20%3D%20%22process%20%232%22%3B%0A%20%20%20%20color%3Dblue%0A%20%20%7D%0A%20%20start%20-%3E%20a0%3B%0A%20%20start%20-%3E%20b0%3B%0A%20%20a1%20-%3E%20b3%3B%0A%20%20b2%20-%3E%20a3%3B%0A%20%20a3%20-%3E%20a0%3B%0A%20%20a3%20-%3E%20end%3B%0A%20%20b3%20-%3E%20end%3B%0A%0A%20%20start%20%5Bshape%3DMdiamond%5D%3B%0A%20%20end%20%5Bshape%3DMsquare%5D%3B%0A%7D
@@ -63,45 +299,635 @@ def get_graph():
 
 
 
+@dataclasses.dataclass
+class Payload:
+    body: bytes
+    body_gzip: bytes
+    mimetype: str
+    etag: str
+    last_modified: float
+
+
+def derive[T](name: str, build: t_abc.Callable[[t.Any], T]) -> T:
+    # an object built from the dataset of the current request, once per dataset even if many threads ask at once
+    d = dataset()
+    if name in d.derived:
+        metrics.derived_cache.inc(result='hit')
+        return d.derived[name]
+
+    with d.lock:
+        lock = d.building.setdefault(name, threading.Lock())
+    with lock:
+        if name not in d.derived:
+            metrics.derived_cache.inc(result='miss')
+            with metrics.build_seconds.timer(name=name):
+                d.derived[name] = build(d.data)
+        else:
+            metrics.derived_cache.inc(result='hit')
+    return d.derived[name]
+
+
+def get_payload(name: str, mimetype: str, build: t_abc.Callable[[t.Any], bytes]) -> Payload:
+    def build_payload(data) -> Payload:
+        with metrics.encode_seconds.timer(payload=name):
+            body = build(data)
+        with metrics.gzip_seconds.timer(payload=name):
+            body_gzip = gzip.compress(body, 9, mtime=0)
+        return Payload(
+            body=body,
+            body_gzip=body_gzip,
+            mimetype=mimetype,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            last_modified=data_last_modified(),
+        )
+
+    return derive(f'payload {name}', build_payload)
+
+
+def data_last_modified() -> float:
+    return max(f.stat().st_mtime for f in dir_events.rglob('*.yaml'))
+
+
+def send_payload(payload: Payload):
+    # identity and gzip are different representations, so they get different strong etags
+    if request.accept_encodings['gzip']:
+        response = make_response(payload.body_gzip)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(payload.etag + '-gzip')
+    else:
+        response = make_response(payload.body)
+        response.set_etag(payload.etag)
+    response.mimetype = payload.mimetype
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.last_modified = payload.last_modified
+    return response.make_conditional(request)
+
+
+def send_json(name: str, body: str) -> Response:
+    # a body built for this request, compressed if the client accepts it; the etag lets a repeated request
+    # (the same filter picked again, say) get a 304 without compressing or sending anything
+    data = body.encode('utf8')
+    gzipped = request.accept_encodings['gzip']
+    etag = hashlib.sha256(data).hexdigest()[:32] + ('-gzip' if gzipped else '')
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    elif gzipped:
+        with metrics.gzip_seconds.timer(payload=name):
+            response = make_response(gzip.compress(data, 6, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(data)
+    response.set_etag(etag)
+    response.mimetype = 'application/json'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def display(data, debug: bool):
+    # rows without the debug fields (`raw`, `mro`, `extra`) unless `debug`, failures are reported by /errors.json
+    rows, errors = display_events(list(data.items()), debug, workers=os.cpu_count() or 1)
+    errors = [*dataset().errors, *errors]
+    metrics.events_displayed.inc(len(rows))
+    metrics.display_failures.inc(len(errors))
+    if errors:
+        print(f'Failed to display {len(errors)} events: {", ".join(e.id for e in errors)}')
+    return [(data[id], row) for id, row in rows], errors
+
+
+def build_rows(data) -> list[tuple[Event, dict[str, t.Any]]]:
+    return derive('display', lambda data: display(data, debug=False))[0]
+
+
+def build_data(data) -> bytes:
+    return json.dumps([row for _, row in derive('rows', build_rows)]).encode('utf8')
+
+
+def build_debug_data(data) -> bytes:
+    rows, _ = derive('display debug', lambda data: display(data, debug=True))
+    return json.dumps([row for _, row in rows]).encode('utf8')
+
+
+def build_facets(data) -> FacetIndex:
+    return FacetIndex(derive('rows', build_rows))
+
+
+def sort_order(index: FacetIndex) -> list[int] | None:
+    # the order asked for with sort=<column>&dir=<asc|desc>
+    if (column := request.args.get('sort')) is None:
+        return None
+    direction = request.args.get('dir', 'asc')
+    if column not in index.orders or direction not in ('asc', 'desc'):
+        abort(400)
+    return index.orders[column][direction]
+
+
+@dataclasses.dataclass
+class Snapshot:
+    version: int
+    digest: str
+    hashes: dict[str, str]  # event id -> hash of its displayed row
+
+
+# snapshots of the last few datasets, to tell clients what changed since the one they have
+_snapshots: collections.OrderedDict[int, Snapshot] = collections.OrderedDict()
+max_snapshots = 32
+
+
+def build_snapshot(data) -> Snapshot:
+    hashes = {
+        e.id: hashlib.sha256(json.dumps(row).encode('utf8')).hexdigest()[:16]
+        for e, row in derive('rows', build_rows)
+    }
+    digest = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode('utf8')).hexdigest()[:16]
+    snapshot = Snapshot(dataset().version, digest, hashes)
+    _snapshots[snapshot.version] = snapshot
+    while len(_snapshots) > max_snapshots:
+        _snapshots.popitem(last=False)
+    return snapshot
+
+
+def changes_since(version: int | None, digest: str | None) -> tuple[set[str], list[str]] | None:
+    # ids of rows added or changed since the given dataset and ids of rows removed since then;
+    # None if that dataset is unknown (too old, or seen by another process, then the digest doesn't match)
+    current = derive('snapshot', build_snapshot)
+    old = _snapshots.get(version) if version is not None else None
+    if old is None or old.digest != digest:
+        return None
+    changed = {id for id, h in current.hashes.items() if old.hashes.get(id) != h}
+    removed = [id for id in old.hashes if id not in current.hashes]
+    return changed, removed
+
+
+def send_stream(name: str, mimetype: str, chunks: t_abc.Callable[[t.Any], t_abc.Iterator[bytes]]):
+    # the body is encoded while it is sent; its etag is computed once per dataset by encoding it without keeping it
+    def build_etag(data) -> str:
+        h = hashlib.sha256()
+        for chunk in chunks(data):
+            h.update(chunk)
+        return h.hexdigest()[:32]
+
+    etag = derive(f'etag {name}', build_etag)
+    last_modified = derive('last modified', lambda data: data_last_modified())
+    data = load_data()
+
+    if request.accept_encodings['gzip']:
+        response = Response(gzip_chunks(chunks(data)), mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag + '-gzip')
+    else:
+        response = Response(chunks(data), mimetype=mimetype)
+        response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.last_modified = last_modified
+    return response.make_conditional(request)
+
+
+def gzip_chunks(chunks: t_abc.Iterator[bytes]) -> t_abc.Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if out := z.compress(chunk):
+            yield out
+    yield z.flush()
+
+
+def dump_default(o: t.Any) -> t.Any:
+    # lets json encode what `c3.dump` would convert
+    if isinstance(o, (C, t_abc.Set)):
+        return dump(o)
+    raise TypeError(f'Object of type {o.__class__.__name__} is not JSON serializable')
+
+
+def iter_raw(data) -> t_abc.Iterator[bytes]:
+    # same bytes as `json.dumps({e.id: e.dump() ...}, indent=2, ensure_ascii=False)`, one event at a time
+    empty = True
+    for _, e in data.items():
+        key = json.dumps(e.id, ensure_ascii=False)
+        value = json.dumps(e, default=dump_default, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+        yield f'{'{' if empty else ','}\n  {key}: {value}'.encode('utf8')
+        empty = False
+    yield b'{}' if empty else b'\n}'
+
+
+def iter_ndjson(data) -> t_abc.Iterator[bytes]:
+    for _, e in data.items():
+        yield (json.dumps(e, default=dump_default, ensure_ascii=False) + '\n').encode('utf8')
+
+
+def build_columns(data) -> bytes:
+    return app.json.response(Event.table_columns).get_data()
+
+
 @app.route('/data.json')
 def get_data():
-    content = []
-    for id, e in load_data().items():
-        try:
-            content += [e.display()]
-        except Exception:
-            import traceback
-
-            print(f'Failed to display {id}:')
-            traceback.print_exc()
-    content = gzip.compress(json.dumps(content).encode('utf8'), 5)
-    response = make_response(content)
-    response.headers['Content-Length'] = str(len(content))
-    response.headers['Content-Encoding'] = 'gzip'
+    # /data.json?since=<version>&digest=<digest> returns only what changed since that dataset:
+    # {"version", "digest", "full", "rows", "removed"}, with "full": true and all rows if the dataset is unknown.
+    # /data.json?sort=<column>&dir=<asc|desc>&offset=&limit= returns a page of rows sorted by a column.
+    # rows have the debug fields only in /data.json?debug=1
+    if 'since' not in request.args:
+        if request.args.get('debug') == '1':
+            return send_payload(get_payload('data debug', 'application/json', build_debug_data))
+        if not {'sort', 'offset', 'limit'} & request.args.keys():
+            return send_payload(get_payload('data', 'application/json', build_data))
+
+        index = derive('facets', build_facets)
+        order = sort_order(index) or range(index.size)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = request.args.get('limit', None, type=int)
+        page = order[offset:] if limit is None else order[offset : offset + max(0, limit)]
+        return send_json('data page', index.dump(page))
+
+    snapshot = derive('snapshot', build_snapshot)
+    rows = derive('rows', build_rows)
+    changes = changes_since(request.args.get('since', type=int), request.args.get('digest'))
+    if changes is None:
+        body = {'full': True, 'rows': [row for _, row in rows], 'removed': []}
+    else:
+        changed, removed = changes
+        body = {'full': False, 'rows': [row for e, row in rows if e.id in changed], 'removed': removed}
+    return send_json('data since', json.dumps({'version': snapshot.version, 'digest': snapshot.digest} | body))
+
+
+@app.route('/query')
+def get_query():
+    # /query?grade=5&grade=6&meta=0&sort=date&dir=desc&offset=0&limit=100
+    # values of one field are or-ed, fields are and-ed; without `limit` all matching rows are returned.
+    # with since=<version>&digest=<digest> only matching rows changed since then are returned,
+    # "removed" lists rows that are gone or don't match anymore, "full" tells if the dataset was unknown,
+    # "order" lists ids of all matching rows in the order they would be returned in
+    index = derive('facets', build_facets)
+    order = sort_order(index)
+    snapshot = derive('snapshot', build_snapshot)
+    filters = {field: request.args.getlist(field) for field in facet_fields}
+
+    extra: dict[str, t.Any] = {'version': snapshot.version, 'digest': snapshot.digest}
+    within = None
+    if 'since' in request.args:
+        changes = changes_since(request.args.get('since', type=int), request.args.get('digest'))
+        extra['full'] = changes is None
+        extra['removed'] = []
+        if changes is not None:
+            changed, removed = changes
+            within = index.ids_mask(changed)
+            extra['removed'] = removed + index.ids_of(within & ~index.match(filters))
+        extra['order'] = [index.ids[i] for i in index.ordered(index.match(filters), order)]
+
+    return send_json(
+        'query',
+        index.query(
+            filters,
+            offset=max(0, request.args.get('offset', 0, type=int)),
+            limit=request.args.get('limit', None, type=int),
+            within=within,
+            extra=extra,
+            order=order,
+        ),
+    )
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def count_response(response: Response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.requests.inc(route=route, status=response.status_code)
+    metrics.request_seconds.observe(time.perf_counter() - g.request_start, route=route)
+    encoding = response.headers.get('Content-Encoding', 'identity')
+    if response.is_streamed:
+        response.response = count_bytes(response.response, route, encoding)
+    else:
+        metrics.bytes_served.inc(response.calculate_content_length() or 0, route=route, encoding=encoding)
+    return response
+
+
+def count_bytes(chunks: t_abc.Iterable[bytes], route: str, encoding: str) -> t_abc.Iterator[bytes]:
+    for chunk in chunks:
+        metrics.bytes_served.inc(len(chunk), route=route, encoding=encoding)
+        yield chunk
+
+
+@app.route('/metrics')
+def get_metrics():
+    response = make_response(metrics.render())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
+def parse_moment(s: str | None, default: float) -> float:
+    # an iso date, a date written like in events or unix time, in this order: `2024` is a year, not a second
+    if s is None:
+        return default
+    try:
+        return datetime.datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        pass
+    if (ts := get_timestamp(s)) is not None:
+        return ts
+    try:
+        return float(s)
+    except ValueError:
+        abort(400)
+
+
+# grades clients can filter by, a grade is a bit of a mask, so a huge one would make a huge number
+max_grade = 63
+
+
+def upcoming() -> list[Occurrence]:
+    # ?from=&to=&weeks=&grade=: dates of events overlapping [from, to), from now for 4 weeks by default
+    start = parse_moment(request.args.get('from'), time.time())
+    weeks = request.args.get('weeks', 4, type=float)
+    end = parse_moment(request.args.get('to'), start + weeks * 7 * 24 * 60 * 60)
+    grade_list = request.args.getlist('grade', type=int)
+    if not all(0 <= g <= max_grade for g in grade_list):
+        abort(400)
+    grades = Grades.of(grade_list)
+    return derive('timeline', lambda data: TimeIndex(derive('rows', build_rows))).between(start, end, grades)
+
+
+@app.route('/upcoming')
+def get_upcoming():
+    response = make_response(json.dumps([o.to_json() for o in upcoming()], ensure_ascii=False))
+    response.mimetype = 'application/json'
+    return response
+
+
+@app.route('/upcoming.ics')
+def get_upcoming_ics():
+    response = make_response(ics(upcoming(), derive('last modified', lambda data: data_last_modified())))
+    response.mimetype = 'text/calendar'
+    return response
+
+
+@app.route('/errors.json')
+def get_errors():
+    # events that failed to display: [{"id", "type", "message", "traceback"}]
+    _, errors = derive('display', lambda data: display(data, debug=False))
+    response = make_response(json.dumps([dataclasses.asdict(e) for e in errors], ensure_ascii=False))
+    response.mimetype = 'application/json'
     return response
 
 
 @app.route('/columns')
 def get_columns():
-    return jsonify(Event.table_columns)
+    return send_payload(get_payload('columns', 'application/json', build_columns))
+
+
+@app.route('/event/<id>.json')
+def get_event(id: str):
+    # one event as in /raw.json
+    data = loaded_or_lazy_data()
+    if id not in data:
+        abort(404)
+    response = make_response(json.dumps(data[id], default=dump_default, indent=2, ensure_ascii=False))
+    response.mimetype = 'application/json'
+    return response
 
 
 @app.route('/raw.json')
 def get_raw():
+    return send_stream('raw', 'application/json', iter_raw)
+
+
+@app.route('/registry.json')
+def get_registry():
+    # {"files": {file: [[ids of a segment], ...]}, "shadowed": [definitions hidden by an earlier one]}
+    d = dataset()
+    registry = d.registry
     response = make_response(
         json.dumps(
-            {e.id: e.dump() for _, e in load_data().items()},
-            indent=2,
+            {
+                'files': {file.relative_to(d.files.p).as_posix(): ids for file, ids in registry.ids.items()},
+                'shadowed': [
+                    {
+                        'id': s.id,
+                        'file': s.file.relative_to(d.files.p).as_posix(),
+                        'segment': s.segment,
+                        'by_file': s.by_file.relative_to(d.files.p).as_posix(),
+                        'by_segment': s.by_segment,
+                    }
+                    for s in registry.shadowed
+                ],
+            },
             ensure_ascii=False,
         )
     )
-    response.headers['Content-Type'] = 'application/json'
+    response.mimetype = 'application/json'
     return response
 
 
+@app.route('/raw.normalized.json')
+def get_raw_normalized():
+    # every event once with its own attributes and bases, `event.rebuild` turns it into /raw.json
+    return send_payload(
+        get_payload(
+            'raw.normalized',
+            'application/json',
+            lambda data: json.dumps(normalize(data), ensure_ascii=False).encode('utf8'),
+        )
+    )
+
+
+@app.route('/raw.ndjson')
+def get_raw_ndjson():
+    return send_stream('raw.ndjson', 'application/x-ndjson', iter_ndjson)
+
+
+# everything that is the same for all clients, built in the master before workers are forked
+warm_urls = [
+    '/data.json',
+    '/data.json?debug=1',
+    '/columns',
+    '/query',
+    '/raw.json',
+    '/raw.ndjson',
+    '/graph.dot',
+    '/graph.json',
+    '/graph',
+    '/upcoming',
+    '/upcoming.ics',
+    '/errors.json',
+]
+
+
+def warm() -> None:
+    client = app.test_client()
+    for url in warm_urls:
+        for encoding in ['gzip', 'identity']:
+            client.get(url, headers={'Accept-Encoding': encoding}).close()
+
+
+def try_refresh(wait: bool = True) -> bool:
+    # `refresh(prepare=True)` that reports failures instead of raising, the published dataset stays as it was
+    try:
+        return refresh(wait, prepare=True)
+    except Exception:
+        import traceback
+
+        metrics.refresh_failures.inc()
+        print(f'Failed to refresh events, serving version {_dataset.version if _dataset else None}')
+        traceback.print_exc()
+        return False
+
+
+# set by SIGHUP to refresh right away
+_refresh_requested = threading.Event()
+
+
+def refresh_forever(interval: float | None) -> None:
+    # loads the dataset, then refreshes it every `interval` seconds (if given) and whenever asked to
+    while True:
+        try_refresh()
+        _refresh_requested.wait(interval)
+        _refresh_requested.clear()
+
+
+def start(interval: float | None = None) -> None:
+    # loads the dataset in the background as soon as the server starts instead of on the first request,
+    # then keeps it fresh; requests get the old dataset until a new one is ready
+    import signal
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: _refresh_requested.set())
+    threading.Thread(target=refresh_forever, args=(interval,), name='refresh', daemon=True).start()
+
+
+def serve_forked(host: str, port: int, workers: int, interval: float | None = None) -> None:
+    # loads, freezes and encodes the dataset once, then forks workers that serve it from a shared socket.
+    # `gc.freeze` moves everything built so far out of the collector's reach, so collections in workers
+    # don't write to (and copy) the shared pages; workers that die are replaced.
+    # every `interval` seconds (if given) and on SIGHUP the master refreshes the dataset, and if it changed,
+    # forks new workers and stops the old ones after they finish what they are serving
+    import gc
+    import os
+    import signal
+    import socket
+    import traceback
+    from werkzeug.serving import make_server
+
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
+
+    load_data()
+    warm()
+    gc.collect()
+    gc.freeze()
+    print(f'serving on http://{host}:{port} with {workers} workers')
+
+    children: set[int] = set()
+    # workers of older datasets that were told to stop
+    retiring: set[int] = set()
+    # when each worker was started, by `time.monotonic`
+    started: dict[int, float] = {}
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # a worker that fails exits with 1 and leaves the traceback in the log
+            code = 1
+            try:
+                for signum in [signal.SIGHUP, signal.SIGALRM]:
+                    signal.signal(signum, signal.SIG_IGN)
+                server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+                # requests being served when the worker is told to stop are finished first
+                server.daemon_threads = False
+
+                def shutdown(signum: int, frame: t.Any) -> None:
+                    threading.Thread(target=server.shutdown).start()
+
+                signal.signal(signal.SIGTERM, shutdown)
+                signal.signal(signal.SIGINT, shutdown)
+                server.serve_forever()
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children.add(pid)
+        started[pid] = time.monotonic()
+
+    def terminate(pids: set[int]) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum: int, frame: t.Any) -> None:
+        terminate(children | retiring)
+        for pid in children | retiring:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sys.exit(0)
+
+    def reload(signum: int, frame: t.Any) -> None:
+        # a signal that comes while this runs finds the load lock taken and is ignored
+        if not try_refresh(wait=False):
+            return
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        old = set(children)
+        children.clear()
+        retiring.update(old)
+        for _ in range(workers):
+            spawn()
+        terminate(old)
+        print(f'serving version {dataset().version} with new workers')
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+    if interval is not None:
+        signal.signal(signal.SIGALRM, reload)
+        signal.setitimer(signal.ITIMER_REAL, interval, interval)
+
+    # a worker that fails soon after it starts is replaced after a pause that doubles every time, up to a minute,
+    # so a broken one isn't forked again in a tight loop
+    delay = 0.0
+    while True:
+        pid, status = os.wait()
+        uptime = time.monotonic() - started.pop(pid, 0.0)
+        if pid in retiring:
+            retiring.discard(pid)
+            continue
+        children.discard(pid)
+        code = os.waitstatus_to_exitcode(status)
+        delay = min(max(2 * delay, 0.5), 60.0) if code != 0 and uptime < 10 else 0.0
+        print(f'worker {pid} exited with status {code}, starting another one in {delay:g} s')
+        time.sleep(delay)
+        # a reload while waiting may have started a full set of workers already
+        if len(children) < workers:
+            spawn()
+
+
 DEBUG = '--debug' in sys.argv
 
+# `flask run` imports this module in the process that serves it, its `app.run` below does nothing
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and (not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    start(REFRESH)
+
 if __name__ == '__main__':
+    # python3.12 main.py --workers 4 --refresh 600, `kill -HUP <pid>` refreshes right away
+    if '--workers' in sys.argv:
+        serve_forked(
+            host='localhost' if DEBUG else '0.0.0.0',
+            port=5000 if DEBUG else 5001,
+            workers=int(sys.argv[sys.argv.index('--workers') + 1]),
+            interval=REFRESH,
+        )
+    # with the reloader of --debug this process only watches files, the server runs in a child
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start(REFRESH)
     app.run(
         host='localhost' if DEBUG else '0.0.0.0',
         port=5000 if DEBUG else 5001,
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import contextlib
+import dataclasses
+import threading
+import time
+import typing as t
+import collections.abc as t_abc
+
+
+# counters, gauges and summaries exported by /metrics in the prometheus text format.
+# updates are cheap enough for per-request and per-load paths; the per-lookup paths of `c3` and `event`
+# are counted only after `instrument()`, until then they are not touched at all
+
+type Labels = tuple[tuple[str, str], ...]
+
+_lock = threading.Lock()
+
+
+def _labels(labels: dict[str, t.Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+@dataclasses.dataclass
+class Metric:
+    name: str
+    help: str
+    type: str  # 'counter', 'gauge' or 'summary'
+    values: dict[Labels, float] = dataclasses.field(default_factory=dict)  # sums for summaries
+    counts: dict[Labels, int] = dataclasses.field(default_factory=dict)  # observations of summaries
+
+    def inc(self, n: float = 1, **labels: t.Any) -> None:
+        key = _labels(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+    def set(self, value: float, **labels: t.Any) -> None:
+        key = _labels(labels)
+        with _lock:
+            self.values[key] = value
+
+    def observe(self, value: float, **labels: t.Any) -> None:
+        key = _labels(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + value
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with _lock:
+            self.values.clear()
+            self.counts.clear()
+
+    @contextlib.contextmanager
+    def timer(self, **labels: t.Any) -> t_abc.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+registry: dict[str, Metric] = {}
+
+
+def metric(name: str, help: str, type: str) -> Metric:
+    registry[name] = m = Metric(name, help, type)
+    return m
+
+
+def render() -> str:
+    lines: list[str] = []
+    with _lock:
+        snapshot = [(m, sorted(m.values.items()), dict(m.counts)) for m in registry.values()]
+    for m, values, counts in snapshot:
+        lines += [f'# HELP {m.name} {m.help}', f'# TYPE {m.name} {m.type}']
+        for labels, value in values:
+            if m.type == 'summary':
+                lines.append(f'{m.name}_sum{_format_labels(labels)} {value}')
+                lines.append(f'{m.name}_count{_format_labels(labels)} {counts[labels]}')
+            else:
+                lines.append(f'{m.name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# loading
+load_phase_seconds = metric(
+    'olymp_load_phase_seconds', 'Seconds spent in each phase of the last reload', 'gauge'
+)
+file_parse_seconds = metric(
+    'olymp_file_parse_seconds', 'Seconds spent parsing each file during the last reload that parsed it', 'gauge'
+)
+segment_parse_seconds = metric(
+    'olymp_segment_parse_seconds', 'Seconds spent parsing each segment during the last reload that parsed it', 'gauge'
+)
+load_cache = metric('olymp_load_cache_total', 'Disk cache lookups for changed files', 'counter')
+reloads = metric('olymp_reloads_total', 'Reloads that changed the dataset', 'counter')
+refresh_failures = metric(
+    'olymp_refresh_failures_total', 'Background refreshes that failed and left the old dataset served', 'counter'
+)
+freeze_seconds = metric('olymp_freeze_seconds', 'Time spent freezing loaded datasets', 'summary')
+dataset_version = metric('olymp_dataset_version', 'Version of the served dataset', 'gauge')
+dataset_events = metric('olymp_dataset_events', 'Events in the served dataset', 'gauge')
+shadowed_ids = metric('olymp_shadowed_ids', 'Definitions hidden by an earlier one with the same id', 'gauge')
+
+# serving
+build_seconds = metric('olymp_build_seconds', 'Time spent building objects derived from a dataset', 'summary')
+derived_cache = metric('olymp_derived_cache_total', 'Lookups of objects derived from the dataset', 'counter')
+events_displayed = metric('olymp_events_displayed_total', 'Events displayed', 'counter')
+display_failures = metric('olymp_display_failures_total', 'Events that failed to display', 'counter')
+encode_seconds = metric(
+    'olymp_encode_seconds', 'Time spent encoding payloads, with building what they are made of', 'summary'
+)
+gzip_seconds = metric('olymp_gzip_seconds', 'Time spent compressing payloads', 'summary')
+requests = metric('olymp_requests_total', 'Requests served', 'counter')
+request_seconds = metric('olymp_request_seconds', 'Time spent in request handlers', 'summary')
+bytes_served = metric('olymp_response_bytes_total', 'Bytes of response bodies sent', 'counter')
+
+# hot paths, see `instrument`
+lookups = metric('olymp_lookups_total', 'Attribute lookups on events', 'counter')
+mro_cache = metric('olymp_mro_cache_total', 'Requests for the linearization of a C', 'counter')
+mro_seconds = metric('olymp_mro_seconds', 'Time spent linearizing after a cache miss', 'summary')
+linearizations = metric('olymp_linearizations_total', 'Nodes linearized by c3', 'counter')
+invalidations = metric('olymp_mro_invalidations_total', 'Invalidations of all cached linearizations', 'counter')
+
+# unlabeled counters are exported before anything happens
+for _m in (reloads, refresh_failures, events_displayed, display_failures, linearizations, invalidations):
+    _m.inc(0)
+del _m
+
+instrumented = False
+
+
+def instrument() -> None:
+    # replaces hot methods of `C` and `FrozenEvent` with counting wrappers
+    global instrumented
+    if instrumented:
+        return
+    instrumented = True
+
+    import c3
+    import event
+
+    def wrap(owner: t.Any, name: str, make: t_abc.Callable[[t.Any], t_abc.Callable[..., t.Any]]) -> None:
+        fn = getattr(owner, name)
+        wrapper = make(fn)
+        wrapper.__name__ = name
+        wrapper.__wrapped__ = fn  # type: ignore
+        setattr(owner, name, wrapper)
+
+    def counting(kind: str) -> t_abc.Callable[[t.Any], t_abc.Callable[..., t.Any]]:
+        def make(fn: t_abc.Callable[..., t.Any]) -> t_abc.Callable[..., t.Any]:
+            def wrapper(self, *args):
+                lookups.inc(kind=kind)
+                return fn(self, *args)
+
+            return wrapper
+
+        return make
+
+    def make_mro(fn: t_abc.Callable[..., t.Any]) -> t_abc.Callable[..., t.Any]:
+        def wrapper(self):
+            if self.__C_g__ == c3._generation:
+                mro_cache.inc(result='hit')
+                return fn(self)
+            mro_cache.inc(result='miss')
+            before = len(c3._memo)
+            with mro_seconds.timer():
+                res = fn(self)
+            linearizations.inc(len(c3._memo) - before)
+            return res
+
+        return wrapper
+
+    def make_invalidate(fn: t_abc.Callable[..., t.Any]) -> t_abc.Callable[..., t.Any]:
+        def wrapper():
+            invalidations.inc()
+            return fn()
+
+        return wrapper
+
+    # `NS.__getattr__`, `get`, `[]` and `in` of live events all go through `_lookup`;
+    # frozen events answer attributes without it
+    wrap(c3.C, '_lookup', counting('live'))
+    wrap(event.FrozenEvent, '_lookup', counting('frozen'))
+    wrap(event.FrozenEvent, '__getattr__', counting('frozen'))
+    wrap(c3.C, '_mro', make_mro)
+    wrap(c3, '_invalidate', make_invalidate)
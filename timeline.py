@@ -0,0 +1,111 @@
+from __future__ import annotations
+import bisect
+import dataclasses
+import time
+import typing as t
+import collections.abc as t_abc
+
+from event import Event, get_intervals
+
+
+@dataclasses.dataclass
+class Occurrence:
+    start: float
+    end: float  # first second after it
+    note: str | None
+    event: Event
+    name: str
+    index: int  # of the period among the periods of the event, so two on one day don't share a UID
+
+    @property
+    def all_day(self) -> bool:
+        return time.localtime(self.start)[3:6] == time.localtime(self.end)[3:6] == (0, 0, 0)
+
+    def to_json(self) -> dict[str, t.Any]:
+        fmt = '%Y-%m-%d' if self.all_day else '%Y-%m-%dT%H:%M'
+        return {
+            'id': self.event.id,
+            'name': self.name,
+            'note': self.note,
+            'url': self.event.url or None,
+            'start': time.strftime(fmt, time.localtime(self.start)),
+            'end': time.strftime(fmt, time.localtime(self.end)),
+            'all_day': self.all_day,
+        }
+
+
+class TimeIndex:
+    # periods covered by dates of non-meta events, sorted by start for range queries with bisect
+    def __init__(self, rows: list[tuple[Event, dict[str, t.Any]]]):
+        occurrences = []
+        for e, row in rows:
+            if e.id.startswith('$'):
+                continue
+            try:
+                intervals = get_intervals(e.date)
+            except Exception:
+                continue
+            for i, (start, end, note) in enumerate(intervals):
+                occurrences.append(Occurrence(start, end, note, e, row['name']['value'], i))
+        occurrences.sort(key=lambda o: (o.start, o.end))
+        self.occurrences = occurrences
+        self.starts = [o.start for o in occurrences]
+        # only this far before a window can an occurrence start and still overlap it
+        self.longest = max((o.end - o.start for o in occurrences), default=0.0)
+
+    def between(self, start: float, end: float, grades: int = 0) -> list[Occurrence]:
+        # occurrences overlapping [start, end), only of events for one of `grades` (a mask) unless it is 0
+        lo = bisect.bisect_left(self.starts, start - self.longest)
+        hi = bisect.bisect_left(self.starts, end)
+        return [
+            o
+            for o in self.occurrences[lo:hi]
+            if o.end > start and (not grades or int(o.event.grades or 0) & grades)
+        ]
+
+
+def _ics_text(s: str) -> str:
+    return s.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_fold(line: str) -> t_abc.Iterator[str]:
+    # lines are at most 75 octets, continuation lines start with a space
+    data = line.encode('utf8')
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:  # don't split a character
+            cut -= 1
+        yield data[:cut].decode('utf8')
+        data = b' ' + data[cut:]
+    yield data.decode('utf8')
+
+
+def ics(occurrences: list[Occurrence], stamp: float) -> str:
+    # an iCalendar with an event for every occurrence, times are floating (local to the reader)
+    def moment(ts: float, all_day: bool) -> str:
+        if all_day:
+            return ';VALUE=DATE:' + time.strftime('%Y%m%d', time.localtime(ts))
+        return ':' + time.strftime('%Y%m%dT%H%M%S', time.localtime(ts))
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//olymp//upcoming//RU',
+        'CALSCALE:GREGORIAN',
+    ]
+    for o in occurrences:
+        summary = o.name if o.note is None else f'{o.name} ({o.note})'
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:{_ics_text(o.event.id)}-{int(o.start)}-{o.index}@olymp',
+            'DTSTAMP:' + time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(stamp)),
+            'DTSTART' + moment(o.start, o.all_day),
+            'DTEND' + moment(o.end, o.all_day),
+            f'SUMMARY:{_ics_text(summary)}',
+        ]
+        if o.event.url:
+            lines.append(f'URL:{o.event.url}')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return ''.join(f'{part}\r\n' for line in lines for part in _ics_fold(line))